@@ -15,6 +15,7 @@ import logging
 from datetime import datetime
 from openai import OpenAI
 from config import AI_API_KEY, AI_BASE_URL, AI_MODEL, AI_ENABLED
+from detector import fields_changed, is_cancelled
 
 logger = logging.getLogger("untis-watcher")
 
@@ -61,17 +62,6 @@ _EMOJI_CHANGED   = "\U0001f7e2"     # 🟢
 _EMOJI_BULLET    = "\u2022"         # •
 _ARROW           = "\u2192"         # →
 
-# Untis codes / change_type values that mean "this lesson was cancelled"
-_CANCELLED_CODES = {"cancelled", "cancel", "entfall"}
-_CANCELLED_CHANGE_TYPES = {"cancelled", "cancel", "entfall"}
-
-
-def _is_cancelled(lesson: dict) -> bool:
-    """Return True if the lesson's code or change_type signals a cancellation."""
-    code = str(lesson.get("code") or "").lower()
-    change_type = str(lesson.get("change_type") or "").lower()
-    return code in _CANCELLED_CODES or change_type in _CANCELLED_CHANGE_TYPES
-
 
 def _fmt_time(iso: str | None) -> str:
     """Convert ISO timestamp to HH:MM, e.g. '2026-06-08T08:20' -> '08:20'."""
@@ -92,22 +82,58 @@ def _get_subject(lesson: dict) -> str:
     return "Unknown subject"
 
 
-def _get_room(lesson: dict) -> str:
-    rooms = lesson.get("rooms") or []
-    if rooms and isinstance(rooms[0], dict):
-        return rooms[0].get("name") or rooms[0].get("longname") or "?"
-    if rooms and isinstance(rooms[0], str):
-        return rooms[0]
+def _first_name(names: list | None) -> str:
+    """Return the first room/teacher name, or "?" if there is none."""
+    names = names or []
+    if names and isinstance(names[0], dict):
+        return names[0].get("name") or names[0].get("longname") or "?"
+    if names and isinstance(names[0], str):
+        return names[0]
     return "?"
 
 
+def _get_room(lesson: dict) -> str:
+    return _first_name(lesson.get("rooms"))
+
+
 def _get_teacher(lesson: dict) -> str:
-    teachers = lesson.get("teachers") or []
-    if teachers and isinstance(teachers[0], dict):
-        return teachers[0].get("name") or teachers[0].get("longname") or "?"
-    if teachers and isinstance(teachers[0], str):
-        return teachers[0]
-    return "?"
+    return _first_name(lesson.get("teachers"))
+
+
+def _fields_changed(change: dict) -> dict:
+    """Return the change's field map; changes held in state.json by older versions lack one."""
+    fields = change.get("fields_changed")
+    if fields is None:
+        fields = fields_changed(change.get("before") or {}, change.get("after") or change.get("lesson") or {})
+    return fields
+
+
+def _field_details(fields: dict) -> list[str]:
+    """Describe the room, teacher and time differences in a fields_changed map."""
+    details = []
+    for field, label in (("rooms", "room"), ("teachers", "teacher")):
+        if field in fields:
+            old_name = _first_name(fields[field]["before"])
+            new_name = _first_name(fields[field]["after"])
+            if old_name != new_name:
+                details.append(f"{label} {old_name} {_ARROW} {new_name}")
+    if "start" in fields:
+        old_time = _fmt_time(fields["start"]["before"])
+        new_time = _fmt_time(fields["start"]["after"])
+        if old_time != new_time:
+            details.append(f"time {old_time} {_ARROW} {new_time}")
+    return details
+
+
+def _prompt_changes(changes: list[dict]) -> list[dict]:
+    """Changes as sent to the model: each lesson plus its changed fields, without full before/after copies."""
+    prompt_changes = []
+    for change in changes:
+        prompt_change = {key: value for key, value in change.items() if key not in ("before", "after")}
+        if "before" in change:
+            prompt_change["fields_changed"] = _fields_changed(change)
+        prompt_changes.append(prompt_change)
+    return prompt_changes
 
 
 def _structured_summary(changes: list[dict]) -> str:
@@ -133,6 +159,10 @@ def _structured_summary(changes: list[dict]) -> str:
         elif change_type == "removed":
             lines.append(f"{_EMOJI_CANCELLED} CANCELLED: {subject} at {time} — free period!")
 
+        elif change_type == "moved":
+            details = _field_details(_fields_changed(change)) or [f"time {time}"]
+            lines.append(f"{_EMOJI_CHANGED} MOVED: {subject} ({', '.join(details)})")
+
         elif change_type == "exam":
             room = _get_room(lesson)
             teacher = _get_teacher(lesson)
@@ -142,10 +172,10 @@ def _structured_summary(changes: list[dict]) -> str:
             after = change.get("after") or lesson
 
             # ── Cancellation hidden inside a "changed" entry ──────────────────
-            was_normal = not _is_cancelled(before)
-            now_cancelled = _is_cancelled(after)
-            was_cancelled = _is_cancelled(before)
-            now_normal = not _is_cancelled(after)
+            was_normal = not is_cancelled(before)
+            now_cancelled = is_cancelled(after)
+            was_cancelled = is_cancelled(before)
+            now_normal = not is_cancelled(after)
 
             if was_normal and now_cancelled:
                 lines.append(f"{_EMOJI_CANCELLED} CANCELLED: {subject} at {time} — free period!")
@@ -159,27 +189,14 @@ def _structured_summary(changes: list[dict]) -> str:
                 continue
 
             # ── Regular field-level diff ──────────────────────────────────────
-            details = []
-
-            old_room = _get_room(before)
-            new_room = _get_room(after)
-            if old_room != new_room:
-                details.append(f"room {old_room} {_ARROW} {new_room}")
-
-            old_teacher = _get_teacher(before)
-            new_teacher = _get_teacher(after)
-            if old_teacher != new_teacher:
-                details.append(f"teacher {old_teacher} {_ARROW} {new_teacher}")
-
-            old_time = _fmt_time(before.get("start"))
-            new_time = _fmt_time(after.get("start"))
-            if old_time != new_time:
-                details.append(f"time {old_time} {_ARROW} {new_time}")
+            fields = _fields_changed(change)
+            details = _field_details(fields)
 
-            old_code = str(before.get("code") or before.get("change_type") or "normal").lower()
-            new_code = str(after.get("code") or after.get("change_type") or "normal").lower()
-            if old_code != new_code and not details:
-                details.append(f"status {old_code} {_ARROW} {new_code}")
+            if not details and fields.keys() & {"code", "change_type"}:
+                old_code = str(before.get("code") or before.get("change_type") or "normal").lower()
+                new_code = str(after.get("code") or after.get("change_type") or "normal").lower()
+                if old_code != new_code:
+                    details.append(f"status {old_code} {_ARROW} {new_code}")
 
             detail_str = ", ".join(details) if details else "details updated"
             lines.append(f"{_EMOJI_CHANGED} CHANGED: {subject} at {time} ({detail_str})")
@@ -207,7 +224,7 @@ def explain(old_tt: list[dict], new_tt: list[dict], changes: list[dict]) -> str:
     endpoint = AI_BASE_URL or "https://api.openai.com/v1"
     logger.info("[ai] Calling model '%s' at %s ...", AI_MODEL, endpoint)
 
-    changes_json = json.dumps(changes, ensure_ascii=False, indent=2)
+    changes_json = json.dumps(_prompt_changes(changes), ensure_ascii=False, indent=2)
 
     prompt = f"""You are a helpful school assistant for a student named Erdi at \
 Gesamtschule Uellendahl/Katernberg in Germany.
@@ -216,8 +233,10 @@ Explain the timetable changes in friendly, clear English.
 Follow these rules:
 - "cancelled" (Entfall {_EMOJI_CANCELLED}): tell Erdi he has a free period
 - "irregular" (\u00c4nderung {_EMOJI_CHANGED}): explain exactly what changed (room, teacher, or time)
+- "moved" (Verlegung {_EMOJI_CHANGED}): the lesson now takes place at another time; give the old and new time
 - Exams (Pr\u00fcfung {_EMOJI_EXAM}): always mention these FIRST, they are important
 - Be specific: always include subject name, teacher code, time, and room
+- For changed lessons, "fields_changed" lists each field's old ("before") and new ("after") value
 - Keep the summary to 3-5 sentences max
 - If multiple things changed, use a short numbered list inside the message
 - End with a reassuring line if nothing major changed
@@ -0,0 +1,175 @@
+"""
+backoff.py – Shared retry and rate-limit policy for WebUntis HTTP calls.
+
+Every request goes through a per-host token bucket so one process never
+bursts more than RATE_LIMIT_BURST calls at a server, then is retried on
+transport errors and 429/502/503/504 with exponential backoff and full
+jitter. A Retry-After header on 429/503 overrides the computed delay, so
+many watchers sharing one school server spread out instead of retrying in
+lock-step.
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable
+from urllib.parse import urlsplit
+
+from config import (
+    RATE_LIMIT_BURST,
+    RATE_LIMIT_PER_SECOND,
+    RETRY_ATTEMPTS,
+    RETRY_BASE_DELAY,
+    RETRY_MAX_DELAY,
+)
+
+logger = logging.getLogger("untis-watcher")
+
+_RETRY_STATUSES = {429, 502, 503, 504}
+_RETRY_AFTER_STATUSES = {429, 503}
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Return the Retry-After header as seconds to wait (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class TokenBucket:
+    """Thread-safe token bucket; reserve() hands out the wait needed for the next token."""
+
+    def __init__(self, rate: float, capacity: int) -> None:
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take one token and return how many seconds the caller must wait before using it."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+_buckets: dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def bucket_for(url: str) -> TokenBucket:
+    """Return the shared token bucket for url's host."""
+    host = urlsplit(url).netloc
+    with _buckets_lock:
+        if host not in _buckets:
+            _buckets[host] = TokenBucket(RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST)
+        return _buckets[host]
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, honouring Retry-After on 429/503."""
+
+    def __init__(self, attempts: int, base_delay: float, max_delay: float) -> None:
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, retry_after: float | None = None) -> float:
+        """Seconds to wait before retry number attempt (1-based)."""
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        return backoff if retry_after is None else max(retry_after, backoff)
+
+    def _retry_delay(self, response: Any, attempt: int) -> float | None:
+        """Return the delay before retrying response, or None when it should be returned as-is."""
+        if response.status_code not in _RETRY_STATUSES or attempt >= self.attempts:
+            return None
+        retry_after = None
+        if response.status_code in _RETRY_AFTER_STATUSES:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None and retry_after > self.max_delay:
+                # Asked to back off longer than we block a cycle; fail now and let the next poll retry.
+                return None
+        return self.delay(attempt, retry_after)
+
+    def call(
+        self,
+        send: Callable[[], Any],
+        url: str,
+        retry_on: tuple[type[BaseException], ...] = (),
+    ) -> Any:
+        """Rate-limit and retry send() (returning a requests-style response) for url."""
+        bucket = bucket_for(url)
+        attempt = 0
+        while True:
+            attempt += 1
+            time.sleep(bucket.reserve())
+            try:
+                response = send()
+            except retry_on as exc:
+                if attempt >= self.attempts:
+                    raise
+                wait = self.delay(attempt)
+                logger.warning("[retry] %s failed (%s); retry %d/%d in %.1fs.",
+                               urlsplit(url).netloc, type(exc).__name__, attempt, self.attempts - 1, wait)
+                time.sleep(wait)
+                continue
+
+            wait = self._retry_delay(response, attempt)
+            if wait is None:
+                return response
+            logger.warning("[retry] %s answered HTTP %s; retry %d/%d in %.1fs.",
+                           urlsplit(url).netloc, response.status_code, attempt, self.attempts - 1, wait)
+            response.close()
+            time.sleep(wait)
+
+    async def acall(
+        self,
+        send: Callable[[], Awaitable[Any]],
+        url: str,
+        retry_on: tuple[type[BaseException], ...] = (),
+    ) -> Any:
+        """Async variant of call() for httpx responses; shares the same host buckets."""
+        bucket = bucket_for(url)
+        attempt = 0
+        while True:
+            attempt += 1
+            await asyncio.sleep(bucket.reserve())
+            try:
+                response = await send()
+            except retry_on as exc:
+                if attempt >= self.attempts:
+                    raise
+                wait = self.delay(attempt)
+                logger.warning("[retry] %s failed (%s); retry %d/%d in %.1fs.",
+                               urlsplit(url).netloc, type(exc).__name__, attempt, self.attempts - 1, wait)
+                await asyncio.sleep(wait)
+                continue
+
+            wait = self._retry_delay(response, attempt)
+            if wait is None:
+                return response
+            logger.warning("[retry] %s answered HTTP %s; retry %d/%d in %.1fs.",
+                           urlsplit(url).netloc, response.status_code, attempt, self.attempts - 1, wait)
+            await response.aclose()
+            await asyncio.sleep(wait)
+
+
+DEFAULT_POLICY = RetryPolicy(RETRY_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY)
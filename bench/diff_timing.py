@@ -0,0 +1,92 @@
+"""
+diff_timing.py – Time normalising and diffing two large timetable snapshots.
+
+Run from the repository root:
+    python bench/diff_timing.py [--lessons 10000] [--changed 100] [--repeat 5]
+
+Builds a synthetic snapshot, changes the room of --changed random lessons in
+a copy, then times (best of --repeat) what a poll does with the pair:
+- before: the pre-user-015/016 detector (frozen in bench/detector_before.py)
+  normalises both to compare them, then find_changes() normalises them again
+- after: prepare both (normalise, fingerprint, day hashes), compare root
+  hashes and find_changes()
+Also times the current find_changes() straight on the raw lists. Every row
+must find exactly --changed changes.
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import detector  # noqa: E402
+import detector_before  # noqa: E402
+
+
+def snapshot(count: int) -> list[dict]:
+    lessons = []
+    for index in range(count):
+        day = f"2026-{10 + index // 5000:02d}-{1 + (index // 200) % 28:02d}"
+        hour = 8 + index % 8
+        lessons.append({
+            "id": index,
+            "start": f"{day}T{hour:02d}:00",
+            "end": f"{day}T{hour:02d}:45",
+            "subjects": [f"S{index % 30}"],
+            "teachers": [f"T{index % 50}", f"T{(index + 7) % 50}"],
+            "rooms": [f"R{index % 40}"],
+            "code": None,
+            "change_type": "normal",
+            "info": "",
+            "lstext": "x" * 20,
+        })
+    return lessons
+
+
+def best_of(repeat: int, run) -> tuple[float, int]:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        changes = run()
+        timings.append(time.perf_counter() - started)
+    return min(timings), len(changes)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--lessons", type=int, default=10_000)
+    parser.add_argument("--changed", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(1)
+    old = snapshot(args.lessons)
+    new = [dict(lesson) for lesson in old]
+    for index in random.sample(range(args.lessons), args.changed):
+        new[index]["rooms"] = ["Z1"]
+
+    def before_poll() -> list[dict]:
+        if detector_before.timetables_equal(old, new):
+            return []
+        return detector_before.find_changes(old, new)
+
+    def prepared_poll() -> list[dict]:
+        before, after = detector.prepare(old), detector.prepare(new)
+        return [] if before.root == after.root else detector.find_changes(before, after)
+
+    print(f"{args.lessons} lesson(s), {args.changed} changed, best of {args.repeat}:")
+    for label, run in (
+        ("before: normalise + diff", before_poll),
+        ("after: prepare + find_changes", prepared_poll),
+        ("find_changes on raw lists", lambda: detector.find_changes(old, new)),
+    ):
+        elapsed, changes = best_of(args.repeat, run)
+        assert changes == args.changed, f"{label}: {changes} change(s)"
+        print(f"  {label:<30} {elapsed:6.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+fetch_throughput.py – Stub-server test of timetable_async against the sync client.
+
+Run from the repository root with the usual .env (or dummy UNTIS_* values):
+    python bench/fetch_throughput.py [--elements 16] [--latency 0.2] [--workers 4]
+
+Both clients log in to bench/stub_untis.py and fetch the same elements. The
+script asserts they return identical lessons and digests, that the async
+client works across several event loops and over a sync login (ASYNC_FETCH),
+and prints the wall-clock time of a serial, a threaded and an async fetch.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# The per-host rate limit protects real servers; against the stub it would only measure itself.
+os.environ["RATE_LIMIT_PER_SECOND"] = "0"
+
+import stub_untis  # noqa: E402
+import timetable  # noqa: E402
+import timetable_async  # noqa: E402
+
+
+def _timed(label: str, run):
+    started = time.perf_counter()
+    results = run()
+    elapsed = time.perf_counter() - started
+    print(f"  {label:<28} {elapsed:6.2f} s")
+    return results, elapsed
+
+
+async def _fetch_async(elements: list[dict], workers: int) -> list[timetable.FetchResult]:
+    session = await timetable_async.get_session()
+    try:
+        return await timetable_async.fetch_many_results(session, elements, max_concurrency=workers)
+    finally:
+        await timetable_async.logout(session)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--elements", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds the stub waits per getTimetable")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    # Compare buffered responses on both sides; the async client never streams.
+    timetable.STREAM_TIMETABLE = False
+    elements = [{"type": 2, "id": element_id} for element_id in range(1, args.elements + 1)]
+
+    with stub_untis.serve(latency=args.latency) as url:
+        timetable._jsonrpc_url = lambda: url
+        print(f"{args.elements} element(s), {args.latency:.2f} s latency each, {args.workers} worker(s):")
+
+        session = timetable.get_session()
+        try:
+            serial, serial_time = _timed(
+                "sync, one at a time", lambda: timetable.fetch_many_results(session, elements, max_workers=1))
+            threaded, _ = _timed(
+                "sync, thread pool", lambda: timetable.fetch_many_results(session, elements, max_workers=args.workers))
+            over_login, _ = _timed(
+                "async, over the sync login",
+                lambda: timetable_async.run_fetch_many_results(session, elements, max_concurrency=args.workers))
+        finally:
+            timetable.logout(session)
+
+        # Two event loops in a row: nothing may stay bound to the first one.
+        first, _ = _timed("async, own login (loop 1)", lambda: asyncio.run(_fetch_async(elements, args.workers)))
+        second, async_time = _timed("async, own login (loop 2)", lambda: asyncio.run(_fetch_async(elements, args.workers)))
+
+    for results in (threaded, over_login, first, second):
+        assert [result.digest for result in results] == [result.digest for result in serial]
+        assert [result.lessons for result in results] == [result.lessons for result in serial]
+    if args.elements >= 2 * args.workers and args.latency > 0:
+        assert async_time < serial_time * 0.75, "async fetches did not overlap"
+    print("Async client stub-server checks passed.")
+
+
+if __name__ == "__main__":
+    main()
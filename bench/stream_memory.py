@@ -0,0 +1,72 @@
+"""
+stream_memory.py – Peak memory of parsing one large getTimetable response, buffered vs streamed.
+
+Run from the repository root with the usual .env (or dummy UNTIS_* values):
+    python bench/stream_memory.py [--periods 20000]
+
+Builds a synthetic JSON-RPC response (bench/stub_untis.py periods) and feeds
+it to timetable.fetch() through an in-memory response, once with
+STREAM_TIMETABLE off and once on. Peak allocations during each parse are
+measured with tracemalloc; the body itself is allocated beforehand and not
+counted. Both runs must return the same lessons.
+"""
+
+import argparse
+import io
+import json
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import requests  # noqa: E402
+
+import stub_untis  # noqa: E402
+import timetable  # noqa: E402
+
+_PERIODS_PER_DAY = 100
+
+
+def _response(body: bytes) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response.raw = io.BytesIO(body)
+    return response
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--periods", type=int, default=20_000)
+    args = parser.parse_args()
+
+    start = date(2026, 1, 5)
+    end = start + timedelta(days=max(1, args.periods // _PERIODS_PER_DAY) - 1)
+    periods = stub_untis.timetable_periods(7, start, end, _PERIODS_PER_DAY)
+    body = json.dumps({"jsonrpc": "2.0", "id": "timetable", "result": periods}).encode("utf-8")
+    del periods
+    print(f"{args.periods} period(s), {len(body) / 1e6:.1f} MB response:")
+
+    timetable._jsonrpc_post = lambda *args, **kwargs: _response(body)
+    session = SimpleNamespace(_person_id=7, _person_type=2)
+    results = []
+    for stream in (False, True):
+        timetable.STREAM_TIMETABLE = stream
+        tracemalloc.start()
+        started = time.perf_counter()
+        lessons = timetable.fetch(session, window=(start, end))
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results.append(lessons)
+        label = "streamed" if stream else "buffered"
+        print(f"  {label:<10} peak {peak / 1e6:6.1f} MB  {elapsed:5.2f} s  {len(lessons)} lesson(s)")
+
+    assert results[0] == results[1], "streamed and buffered parses differ"
+
+
+if __name__ == "__main__":
+    main()
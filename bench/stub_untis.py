@@ -0,0 +1,83 @@
+"""
+stub_untis.py – Local stand-in for the WebUntis JSON-RPC endpoint, used by the bench/ scripts.
+
+Answers authenticate, getLatestImportTime, getTimetable and logout. Every
+getTimetable reply carries `periods` lessons per day and is delayed by
+`latency` seconds, so concurrent clients can be compared without a school.
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator
+
+
+def timetable_periods(element_id: int, start: date, end: date, periods: int) -> list[dict]:
+    """Deterministic getTimetable periods for one element between start and end (inclusive)."""
+    result = []
+    day = start
+    while day <= end:
+        for slot in range(periods):
+            begin = 700 + slot % 12 * 50
+            result.append({
+                "id": element_id * 1_000_000 + (day - start).days * 100 + slot,
+                "date": int(day.strftime("%Y%m%d")),
+                "startTime": begin,
+                "endTime": begin + 45,
+                "su": [{"id": slot % 20, "name": f"S{slot % 20}"}],
+                "te": [{"id": element_id, "name": f"T{element_id}"}],
+                "ro": [{"id": slot % 30, "name": f"R{slot % 30}"}],
+                "code": "cancelled" if slot % 17 == 0 else None,
+            })
+        day += timedelta(days=1)
+    return result
+
+
+def _parse_date(value: str | int) -> date:
+    return datetime.strptime(str(value), "%Y%m%d").date()
+
+
+@contextmanager
+def serve(*, latency: float = 0.0, periods: int = 8) -> Iterator[str]:
+    """Run the stub on a free local port; yields its JSON-RPC URL."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            method, params = body["method"], body.get("params") or {}
+            if method == "authenticate":
+                result = {"sessionId": "stub-session", "personId": 1, "personType": 5}
+            elif method == "getLatestImportTime":
+                result = 1
+            elif method == "getTimetable":
+                time.sleep(latency)
+                options = params["options"]
+                result = timetable_periods(
+                    int(options["element"]["id"]),
+                    _parse_date(options["startDate"]),
+                    _parse_date(options["endDate"]),
+                    periods,
+                )
+            else:
+                result = None
+            payload = json.dumps({"jsonrpc": "2.0", "id": body["id"], "result": result}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/WebUntis/jsonrpc.do"
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -79,6 +79,118 @@ else:
 TELEGRAM_TOKEN   = os.environ["TELEGRAM_TOKEN"]
 TELEGRAM_CHAT_ID = os.environ["TELEGRAM_CHAT_ID"]
 
+# ── Watched elements ───────────────────────────────────────────────────────────────────────
+# UNTIS_ELEMENTS: optional comma-separated list of classes/teachers/rooms to
+# watch from one process, as "type:id" entries. Append "@chat_id" to route an
+# element's notifications to a different Telegram chat, e.g.
+#   UNTIS_ELEMENTS=1:123,1:124@-1001234567890,4:55
+# Leave unset to watch only the logged-in user's own timetable.
+def _parse_elements(raw: str) -> list[dict]:
+    elements = []
+    for entry in filter(None, (part.strip() for part in raw.split(","))):
+        spec, _, chat_id = entry.partition("@")
+        element_type, sep, element_id = spec.partition(":")
+        if not sep or not element_type.strip().isdigit() or not element_id.strip().isdigit():
+            raise ValueError(f"Invalid UNTIS_ELEMENTS entry {entry!r}; expected 'type:id' or 'type:id@chat_id'.")
+        elements.append({
+            "key": f"{int(element_type)}:{int(element_id)}",
+            "type": int(element_type),
+            "id": int(element_id),
+            "chat_id": chat_id.strip() or TELEGRAM_CHAT_ID,
+        })
+    return elements
+
+
+UNTIS_ELEMENTS = _parse_elements(os.getenv("UNTIS_ELEMENTS", ""))
+FETCH_WORKERS  = int(os.getenv("FETCH_WORKERS", "4"))   # elements fetched in parallel
+# ASYNC_FETCH: set to "true" to fetch the watched elements on one asyncio event
+# loop (timetable_async) instead of a thread pool, over the same JSON-RPC login.
+ASYNC_FETCH = os.getenv("ASYNC_FETCH", "false").strip().lower() == "true"
+# DIFF_PROCESSES: when > 1 and at least 16 elements changed in one poll, their
+# diffs are spread over that many worker processes. 0 diffs in-process.
+DIFF_PROCESSES = int(os.getenv("DIFF_PROCESSES", "0"))
+
 # ── Polling behaviour ────────────────────────────────────────────────────────────────────────
 POLL_INTERVAL = int(os.getenv("POLL_INTERVAL", "300"))   # seconds between polls
 DAYS_AHEAD    = int(os.getenv("DAYS_AHEAD", "7"))        # how many days to fetch
+
+# ADAPTIVE_POLLING: when "true", the sleep between polls follows the school
+# calendar (cached getHolidays/getTimegridUnits plus the current baseline)
+# instead of a fixed POLL_INTERVAL. POLL_INTERVAL is then the daytime
+# interval on school days outside the active window around lessons.
+ADAPTIVE_POLLING      = os.getenv("ADAPTIVE_POLLING", "false").strip().lower() == "true"
+POLL_INTERVAL_ACTIVE  = int(os.getenv("POLL_INTERVAL_ACTIVE", "120"))    # before/during the day's lessons
+POLL_INTERVAL_NIGHT   = int(os.getenv("POLL_INTERVAL_NIGHT", "1800"))    # school nights
+POLL_INTERVAL_WEEKEND = int(os.getenv("POLL_INTERVAL_WEEKEND", "3600"))  # days without lessons
+POLL_INTERVAL_HOLIDAY = int(os.getenv("POLL_INTERVAL_HOLIDAY", "7200"))  # WebUntis holidays
+POLL_ACTIVE_LEAD      = int(os.getenv("POLL_ACTIVE_LEAD", "3600"))       # seconds before first lesson
+POLL_NIGHT_START      = int(os.getenv("POLL_NIGHT_START", "22"))         # hour night mode begins
+POLL_NIGHT_END        = int(os.getenv("POLL_NIGHT_END", "6"))            # hour night mode ends
+
+# CONDITIONAL_FETCH: when "true" (default), each poll first asks WebUntis for
+# its latest import time and skips getTimetable entirely if nothing has been
+# imported since the stored baseline was fetched. JSON-RPC mode only.
+CONDITIONAL_FETCH = os.getenv("CONDITIONAL_FETCH", "true").strip().lower() != "false"
+
+# TIERED_FETCH: when "true", most polls only request today and tomorrow. The
+# rest of the next week is re-fetched once FETCH_TIER_WEEK_MAX_AGE seconds have
+# passed, and the whole DAYS_AHEAD window once FETCH_TIER_FULL_MAX_AGE have.
+# Changes are diffed only inside the window that was fetched.
+TIERED_FETCH            = os.getenv("TIERED_FETCH", "false").strip().lower() == "true"
+FETCH_TIER_WEEK_MAX_AGE = int(os.getenv("FETCH_TIER_WEEK_MAX_AGE", "1800"))   # next 7 days
+FETCH_TIER_FULL_MAX_AGE = int(os.getenv("FETCH_TIER_FULL_MAX_AGE", "10800"))  # whole window
+
+# PRUNE_PAST_LESSONS: when "true" (default), lessons that ended more than
+# PAST_LESSON_GRACE seconds ago are dropped from every fetch and from the
+# stored baselines, so they are neither diffed nor notified nor kept in state.json.
+PRUNE_PAST_LESSONS = os.getenv("PRUNE_PAST_LESSONS", "true").strip().lower() != "false"
+PAST_LESSON_GRACE  = int(os.getenv("PAST_LESSON_GRACE", "3600"))
+
+# STATE_SNAPSHOT_EVERY: state changes are appended to state.log and folded
+# into a fresh state.json snapshot every this many changes, or once
+# STATE_COMPACT_INTERVAL seconds have passed since the last snapshot.
+# 0 rewrites state.json on every change instead.
+STATE_SNAPSHOT_EVERY   = int(os.getenv("STATE_SNAPSHOT_EVERY", "50"))
+STATE_COMPACT_INTERVAL = int(os.getenv("STATE_COMPACT_INTERVAL", "86400"))
+
+# FLAP_HOLD_POLLS / FLAP_HOLD_SECONDS: hold a lesson's change until it has
+# lasted that many polls (1 = no poll limit) and, if > 0, that many seconds,
+# so a lesson flipping back and forth during a WebUntis import is reported
+# once or not at all. Exams and cancellations starting within
+# FLAP_URGENT_HORIZON seconds are never held.
+FLAP_HOLD_POLLS     = int(os.getenv("FLAP_HOLD_POLLS", "1"))
+FLAP_HOLD_SECONDS   = int(os.getenv("FLAP_HOLD_SECONDS", "0"))
+FLAP_URGENT_HORIZON = int(os.getenv("FLAP_URGENT_HORIZON", "172800"))   # two days
+
+# MASTERDATA_TTL: seconds the subjects/teachers/rooms/classes cache in
+# masterdata.json stays valid (a newer WebUntis import also invalidates it).
+# Set to 0 to disable the cache and have getTimetable name every entry inline.
+MASTERDATA_TTL = int(os.getenv("MASTERDATA_TTL", "86400"))
+
+# STREAM_TIMETABLE: set to "true" to parse getTimetable responses one period
+# at a time while they download instead of decoding the whole body at once.
+# Keeps peak memory flat for multi-week teacher/room timetables.
+STREAM_TIMETABLE = os.getenv("STREAM_TIMETABLE", "false").strip().lower() == "true"
+
+# ── REST bearer token ────────────────────────────────────────────────────────────────────────
+# TOKEN_CACHE: set to "true" to keep the REST bearer token in token_cache.bin,
+# encrypted with a key derived from UNTIS_API_PASSWORD (needs the optional
+# `cryptography` package), so restarts reuse a still-valid token.
+TOKEN_CACHE         = os.getenv("TOKEN_CACHE", "false").strip().lower() == "true"
+TOKEN_REFRESH_AHEAD = int(os.getenv("TOKEN_REFRESH_AHEAD", "60"))  # background renewal lead, seconds
+
+# ── Retries and rate limiting (all WebUntis calls) ───────────────────────────────────────────
+# Transport errors and HTTP 429/502/503/504 are retried with exponential
+# backoff and full jitter; Retry-After on 429/503 is honoured up to
+# RETRY_MAX_DELAY. Each host gets a token bucket of RATE_LIMIT_BURST requests
+# refilled at RATE_LIMIT_PER_SECOND (0 disables rate limiting).
+RETRY_ATTEMPTS        = int(os.getenv("RETRY_ATTEMPTS", "3"))
+RETRY_BASE_DELAY      = float(os.getenv("RETRY_BASE_DELAY", "1.0"))
+RETRY_MAX_DELAY       = float(os.getenv("RETRY_MAX_DELAY", "60"))
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "2"))
+RATE_LIMIT_BURST      = int(os.getenv("RATE_LIMIT_BURST", "5"))
+
+# ── REST API connection pool ─────────────────────────────────────────────────────────────────
+REST_POOL_SIZE   = int(os.getenv("REST_POOL_SIZE", "4"))    # keep-alive connections kept open
+# Pages fetched in parallel once the first page reports totalPages; keep <= REST_POOL_SIZE
+REST_PAGE_WORKERS = int(os.getenv("REST_PAGE_WORKERS", "4"))
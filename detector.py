@@ -4,11 +4,28 @@ detector.py – Deterministically normalise, compare, and diff timetable snapsho
 
 import hashlib
 import json
+import operator
+from collections.abc import Hashable, Iterable, Mapping
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, datetime
 from typing import Any
 
+from lesson import FIELDS, Lesson
+
 _MISSING_ID_SORT_KEY = "\uffff__missing_lesson_id__"
 _MISSING_ID_MATCH_KEYS = {"start", "end", "subjects"}
 _ORDER_INSENSITIVE_LIST_FIELDS = {"subjects", "teachers", "rooms"}
+# JSON scalars are returned unchanged by _normalise_value
+_SCALAR_TYPES = (str, int, float, bool, type(None))
+# Lesson digests are blake2b-128; snapshot hashes add them up modulo 2**128
+_DIGEST_SIZE = 16
+_COMBINE_MODULUS = 1 << (8 * _DIGEST_SIZE)
+# Batches smaller than this are diffed in-process even when a pool is allowed
+_POOL_MIN_BATCH = 16
+_lesson_values = operator.attrgetter(*FIELDS)
+# Untis code / change_type values that mean "this lesson was cancelled"
+_CANCELLED_VALUES = frozenset({"cancelled", "cancel", "entfall"})
 
 
 def _normalise_lesson_id(lesson_id: Any) -> str | None:
@@ -20,45 +37,82 @@ def _normalise_lesson_id(lesson_id: Any) -> str | None:
 
 def _normalise_value(value: Any, *, field_name: str | None = None) -> Any:
     """Return a JSON-stable representation for deep comparison."""
-    if isinstance(value, dict):
-        return {str(key): _normalise_value(value[key], field_name=str(key)) for key in sorted(value)}
+    if isinstance(value, _SCALAR_TYPES):
+        return value
+
+    if isinstance(value, Mapping):
+        normalised = {}
+        for key in sorted(value):
+            item = value[key]
+            normalised[str(key)] = item if isinstance(item, _SCALAR_TYPES) else _normalise_value(item, field_name=str(key))
+        return normalised
 
-    if isinstance(value, list):
-        items = [_normalise_value(item) for item in value]
+    if isinstance(value, (list, tuple)):
+        items = [item if isinstance(item, _SCALAR_TYPES) else _normalise_value(item) for item in value]
         if field_name in _ORDER_INSENSITIVE_LIST_FIELDS:
+            if all(isinstance(item, str) for item in items):
+                return sorted(items)
             return sorted(items, key=lambda item: json.dumps(item, sort_keys=True, ensure_ascii=False))
         return items
 
-    if isinstance(value, tuple):
-        return [_normalise_value(item) for item in value]
+    return str(value)
 
-    if isinstance(value, (str, int, float, bool)) or value is None:
-        return value
 
-    return str(value)
+def _serialise_lesson(lesson: dict) -> str:
+    return json.dumps(lesson, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+
+def _fingerprint(serialised: str) -> bytes:
+    return hashlib.blake2b(serialised.encode(), digest_size=_DIGEST_SIZE).digest()
+
+
+def _normalise_lesson(lesson: Mapping) -> dict:
+    normalised_lesson = _normalise_value(lesson)
+    normalised_lesson["id"] = _normalise_lesson_id(lesson.get("id"))
+    return normalised_lesson
+
+
+# (start, end, normalised id, canonical JSON of the lesson)
+_SortKey = tuple[str, str, str, str]
 
 
-def _lesson_sort_key(lesson: dict) -> tuple[str, str, str, str]:
+def _lesson_sort_key(lesson: dict, serialised: str) -> _SortKey:
     normalised_id = _normalise_lesson_id(lesson.get("id")) or _MISSING_ID_SORT_KEY
-    serialised = json.dumps(lesson, sort_keys=True, ensure_ascii=False)
     return (str(lesson.get("start") or ""), str(lesson.get("end") or ""), normalised_id, serialised)
 
 
-def normalise_timetable(tt: list[dict] | None) -> list[dict]:
-    """Return a deterministic, deep-comparable timetable representation."""
-    if not tt:
-        return []
+# Lesson field values -> (sort key, normalised lesson), shared across one prepare_many() batch
+_EntryMemo = dict[tuple, tuple[_SortKey, dict]]
+
 
-    normalised = []
-    for lesson in tt:
-        if not isinstance(lesson, dict):
+def _normalised_entries(tt: list[dict] | None, memo: _EntryMemo | None = None) -> list[tuple[_SortKey, dict]]:
+    """
+    Normalise every lesson, serialise it exactly once, and return (sort key, lesson) pairs in order.
+    Lessons already seen in memo reuse that entry instead of being normalised again.
+    """
+    entries = []
+    for lesson in tt or []:
+        if not isinstance(lesson, Mapping):
             continue
 
-        normalised_lesson = _normalise_value(lesson)
-        normalised_lesson["id"] = _normalise_lesson_id(lesson.get("id"))
-        normalised.append(normalised_lesson)
+        values = _lesson_values(lesson) if memo is not None and type(lesson) is Lesson else None
+        if values is not None and values in memo:
+            entries.append(memo[values])
+            continue
 
-    return sorted(normalised, key=_lesson_sort_key)
+        normalised_lesson = _normalise_lesson(lesson)
+        entry = (_lesson_sort_key(normalised_lesson, _serialise_lesson(normalised_lesson)), normalised_lesson)
+        entries.append(entry)
+        if values is not None:
+            memo[values] = entry
+
+    entries.sort(key=lambda entry: entry[0])
+    return entries
+
+
+def normalise_timetable(tt: list[dict] | None) -> list[dict]:
+    """Return a deterministic, deep-comparable timetable representation."""
+    return [lesson for _, lesson in _normalised_entries(tt)]
 
 
 def timetables_equal(old: list[dict] | None, new: list[dict] | None) -> bool:
@@ -66,13 +120,58 @@ def timetables_equal(old: list[dict] | None, new: list[dict] | None) -> bool:
     return normalise_timetable(old) == normalise_timetable(new)
 
 
-def _serialise_normalised(tt: list[dict] | None) -> str:
-    return json.dumps(normalise_timetable(tt), sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+def _serialise(normalised: list[dict]) -> str:
+    return json.dumps(normalised, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+
+def lesson_digest(lesson: Mapping) -> bytes:
+    """Return the blake2b digest of one lesson's canonical (deep-normalised) JSON."""
+    return _fingerprint(_serialise_lesson(_normalise_lesson(lesson)))
+
+
+def combine_digests(digests: Iterable[bytes]) -> str:
+    """Combine lesson digests into one hex snapshot hash; order does not matter."""
+    total = sum(int.from_bytes(digest, "big") for digest in digests) % _COMBINE_MODULUS
+    return f"{total:0{2 * _DIGEST_SIZE}x}"
 
 
 def hash_tt(tt: list[dict] | None) -> str:
-    """Return an MD5 hex-digest of the deep-normalised timetable."""
-    return hashlib.md5(_serialise_normalised(tt).encode()).hexdigest()
+    """
+    Return a blake2b-based hex hash of the deep-normalised timetable.
+    Lessons are normalised and hashed one at a time and their digests combined
+    with combine_digests(), so no timetable-wide JSON string is built.
+    """
+    return combine_digests(lesson_digest(lesson) for lesson in tt or [] if isinstance(lesson, Mapping))
+
+
+def _starts_within(lesson: Any, first_day: str, last_day: str) -> bool:
+    return isinstance(lesson, Mapping) and first_day <= str(lesson.get("start") or "")[:10] <= last_day
+
+
+def _ended_before(lesson: Mapping, cutoff: str) -> bool:
+    end = str(lesson.get("end") or lesson.get("start") or "")
+    return bool(end) and end < cutoff
+
+
+def drop_past(tt: list[dict] | None, cutoff: str) -> list[dict]:
+    """
+    Return the lessons of tt that had not ended by cutoff, a local
+    "YYYY-MM-DDTHH:MM" time. Lessons without start or end are kept.
+    """
+    return [lesson for lesson in tt or [] if not (isinstance(lesson, Mapping) and _ended_before(lesson, cutoff))]
+
+
+def split_by_window(tt: list[dict] | None, start: date, end: date) -> tuple[list[dict], list[dict]]:
+    """Split tt into (lessons starting between start and end inclusive, all other lessons)."""
+    first_day, last_day = start.isoformat(), end.isoformat()
+    inside: list[dict] = []
+    outside: list[dict] = []
+    for lesson in tt or []:
+        if _starts_within(lesson, first_day, last_day):
+            inside.append(lesson)
+        else:
+            outside.append(lesson)
+    return inside, outside
 
 
 def _missing_id_base_key(lesson: dict) -> str:
@@ -85,61 +184,446 @@ def _missing_id_base_key(lesson: dict) -> str:
     return f"missing:{json.dumps(_normalise_value(sig), sort_keys=True, ensure_ascii=False)}"
 
 
-def _index_lessons_by_id(tt: list[dict] | None) -> dict[str, dict]:
+def _index_keys(normalised: list[dict]) -> list[str]:
     """
-    Index lessons by normalised ID.
+    Return the index key of each already-normalised lesson, in order.
     For missing IDs, use a deterministic fallback key plus an occurrence suffix.
     """
-    indexed: dict[str, dict] = {}
+    keys: list[str] = []
     missing_counts: dict[str, int] = {}
 
-    for lesson in normalise_timetable(tt):
+    for lesson in normalised:
         lesson_id = _normalise_lesson_id(lesson.get("id"))
         if lesson_id is None:
             base_key = _missing_id_base_key(lesson)
             occurrence = missing_counts.get(base_key, 0)
             missing_counts[base_key] = occurrence + 1
-            key = f"{base_key}#{occurrence}"
+            keys.append(f"{base_key}#{occurrence}")
         else:
-            key = f"id:{lesson_id}"
-        indexed[key] = lesson
+            keys.append(f"id:{lesson_id}")
+
+    return keys
+
+
+def _start_of(lesson: Mapping) -> str:
+    return str(lesson.get("start") or "")
+
+
+def _day_of(lesson: Mapping) -> str:
+    return _start_of(lesson)[:10]
 
-    return indexed
 
+def root_hash(day_hashes: dict[str, str]) -> str:
+    """Combine per-day hashes into one root hash (order of days does not matter)."""
+    hasher = hashlib.blake2b(digest_size=_DIGEST_SIZE)
+    for day in sorted(day_hashes):
+        hasher.update(f"{day}={day_hashes[day]};".encode())
+    return hasher.hexdigest()
 
-def find_changes(old: list[dict] | None, new: list[dict] | None) -> list[dict]:
+
+def changed_days(old: dict[str, str], new: dict[str, str]) -> list[str]:
+    """Return the days whose hash differs or that exist on one side only, in date order."""
+    return sorted(day for day in old.keys() | new.keys() if old.get(day) != new.get(day))
+
+
+def day_hashes_within(day_hashes: dict[str, str], start: date, end: date) -> dict[str, str]:
+    """Return the day hashes for days between start and end inclusive."""
+    first_day, last_day = start.isoformat(), end.isoformat()
+    return {day: day_hash for day, day_hash in day_hashes.items() if first_day <= day <= last_day}
+
+
+def lessons_on_days(tt: list[dict] | None, days: list[str]) -> list[dict]:
+    """Return the lessons of tt that start on one of days (ISO dates)."""
+    wanted = set(days)
+    return [lesson for lesson in tt or [] if isinstance(lesson, Mapping) and _day_of(lesson) in wanted]
+
+
+@dataclass(frozen=True)
+class PreparedTimetable:
+    """
+    A timetable normalised once, together with its lesson index and a Merkle
+    tree of hashes: one per lesson, one per day and a root over the days.
+    Keep the baseline in this form across poll cycles so only the newly
+    fetched snapshot has to be normalised; build one with prepare().
+    """
+    lessons: list[dict]
+    by_id: dict[str, dict]
+    root: str
+    # ISO date -> hash over the fingerprints of that day's lessons
+    day_hashes: dict[str, str]
+    # ISO date -> index keys (see by_id) of that day's lessons
+    day_keys: dict[str, list[str]] = field(repr=False)
+    # index key -> lesson_digest() of the lesson; combine_digests() of the values equals hash_tt()
+    fingerprints: dict[str, bytes] = field(repr=False)
+    sort_keys: list[_SortKey] = field(repr=False)
+
+    @classmethod
+    def from_entries(cls, entries: list[tuple[_SortKey, dict]]) -> "PreparedTimetable":
+        """Build from sorted (sort key, normalised lesson) pairs, reusing the serialisation in each key."""
+        sort_keys = [key for key, _ in entries]
+        lessons = [lesson for _, lesson in entries]
+        index_keys = _index_keys(lessons)
+
+        fingerprints: dict[str, bytes] = {}
+        day_hashers: dict[str, Any] = {}
+        day_keys: dict[str, list[str]] = {}
+        for index_key, key in zip(index_keys, sort_keys):
+            fingerprint = _fingerprint(key[3])
+            fingerprints[index_key] = fingerprint
+            day = key[0][:10]
+            if day not in day_hashers:
+                day_hashers[day] = hashlib.blake2b(digest_size=_DIGEST_SIZE)
+                day_keys[day] = []
+            day_hashers[day].update(fingerprint)
+            day_keys[day].append(index_key)
+
+        day_hashes = {day: hasher.hexdigest() for day, hasher in day_hashers.items()}
+        return cls(
+            lessons=lessons,
+            by_id=dict(zip(index_keys, lessons)),
+            root=root_hash(day_hashes),
+            day_hashes=day_hashes,
+            day_keys=day_keys,
+            fingerprints=fingerprints,
+            sort_keys=sort_keys,
+        )
+
+    def _entries(self) -> list[tuple[_SortKey, dict]]:
+        return list(zip(self.sort_keys, self.lessons))
+
+    def select_days(self, days: list[str]) -> "PreparedTimetable":
+        """Return only the lessons on days, without re-normalising."""
+        wanted = set(days)
+        return PreparedTimetable.from_entries([entry for entry in self._entries() if entry[0][0][:10] in wanted])
+
+    def replace_window(self, start: date, end: date, current: "PreparedTimetable") -> "PreparedTimetable":
+        """Return this timetable with the lessons between start and end replaced by current's."""
+        first_day, last_day = start.isoformat(), end.isoformat()
+        entries = [entry for entry in self._entries() if not _starts_within(entry[1], first_day, last_day)]
+        entries += current._entries()
+        entries.sort(key=lambda entry: entry[0])
+        return PreparedTimetable.from_entries(entries)
+
+    def drop_past(self, cutoff: str) -> "PreparedTimetable":
+        """Return only the lessons that had not ended by cutoff (see drop_past())."""
+        return PreparedTimetable.from_entries([entry for entry in self._entries() if not _ended_before(entry[1], cutoff)])
+
+    def index_on_days(self, days: list[str]) -> dict[str, dict]:
+        """Return the by_id entries for lessons on days."""
+        return {key: self.by_id[key] for day in days for key in self.day_keys.get(day, ())}
+
+
+def prepare(tt: list[dict] | None) -> PreparedTimetable:
+    """Normalise tt once and build its lesson, day and root hashes."""
+    return PreparedTimetable.from_entries(_normalised_entries(tt))
+
+
+def prepare_many(tts: Iterable[list[dict] | None]) -> list[PreparedTimetable]:
+    """
+    prepare() several timetables with one shared table of normalised Lessons,
+    so a lesson present in several of them (the same period seen from its
+    class, teacher and room, or unchanged between two snapshots) is
+    normalised and serialised once.
+    """
+    memo: _EntryMemo = {}
+    return [PreparedTimetable.from_entries(_normalised_entries(tt, memo)) for tt in tts]
+
+
+def fields_changed(before: Mapping, after: Mapping) -> dict[str, dict[str, Any]]:
+    """Return {field: {"before": old value, "after": new value}} for every field that differs, except id."""
+    changed = {}
+    for key in (*before, *(key for key in after if key not in before)):
+        if key != "id" and before.get(key) != after.get(key):
+            changed[key] = {"before": before.get(key), "after": after.get(key)}
+    return changed
+
+
+def _change_record(change_type: str, before: dict, after: dict, changed: dict[str, dict[str, Any]]) -> dict:
+    return {"type": change_type, "lesson": after, "before": before, "after": after, "fields_changed": changed}
+
+
+# Buckets larger than this pair removed/added lessons in start order instead of by cost
+_MAX_MATCH_PAIRS = 64
+
+
+def _minutes(value: Any) -> int | None:
+    try:
+        moment = datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    return moment.hour * 60 + moment.minute
+
+
+def _move_key(lesson: Mapping) -> tuple | None:
+    """Bucket for move matching: (date, subjects, teachers), None if too vague to match."""
+    subjects = lesson.get("subjects") or []
+    teachers = lesson.get("teachers") or []
+    if not subjects and not teachers:
+        return None
+    return _day_of(lesson), _serialise(subjects), _serialise(teachers)
+
+
+def _move_cost(before: Mapping, after: Mapping) -> int:
+    """Minutes the lesson start and length shifted, plus a penalty for a room change."""
+    cost = 0
+    for field_name in ("start", "end"):
+        old_minutes, new_minutes = _minutes(before.get(field_name)), _minutes(after.get(field_name))
+        if old_minutes is None or new_minutes is None:
+            cost += 0 if before.get(field_name) == after.get(field_name) else 24 * 60
+        else:
+            cost += abs(new_minutes - old_minutes)
+    if before.get("rooms") != after.get("rooms"):
+        cost += 30
+    return cost
+
+
+def _match_moves(removed: list[dict], added: list[dict]) -> list[tuple[dict, dict]]:
+    """
+    Pair removed with added lessons that look like the same lesson moved:
+    same date, subjects and teachers. Within a bucket the cheapest pairs win
+    (see _move_cost); buckets are tiny in practice, so this stays linear.
+    """
+    removed_buckets: dict[tuple, list[dict]] = {}
+    for lesson in removed:
+        key = _move_key(lesson)
+        if key is not None:
+            removed_buckets.setdefault(key, []).append(lesson)
+
+    added_buckets: dict[tuple, list[dict]] = {}
+    for lesson in added:
+        key = _move_key(lesson)
+        if key in removed_buckets:
+            added_buckets.setdefault(key, []).append(lesson)
+
+    pairs = []
+    for key, candidates in added_buckets.items():
+        originals = removed_buckets[key]
+        if len(originals) * len(candidates) > _MAX_MATCH_PAIRS:
+            pairs.extend(zip(sorted(originals, key=_start_of), sorted(candidates, key=_start_of)))
+            continue
+        costs = sorted(
+            (_move_cost(before, after), i, j)
+            for i, before in enumerate(originals)
+            for j, after in enumerate(candidates)
+        )
+        used_old: set[int] = set()
+        used_new: set[int] = set()
+        for _, i, j in costs:
+            if i not in used_old and j not in used_new:
+                used_old.add(i)
+                used_new.add(j)
+                pairs.append((originals[i], candidates[j]))
+    return pairs
+
+
+def find_changes(
+    old: list[dict] | PreparedTimetable | None,
+    new: list[dict] | PreparedTimetable | None,
+    days: list[str] | None = None,
+) -> list[dict]:
     """
     Deep-compare two normalised timetable snapshots by lesson ID.
+    Either side may be a PreparedTimetable, whose index is used as-is.
+
+    Equal root hashes mean no changes. Otherwise only lessons on days whose
+    day hash differs are compared; pass days to name them explicitly, e.g.
+    when old only holds the changed days of a larger baseline.
 
     Returns a list of change dicts, each with:
-      - type:   "added" | "removed" | "changed" | "exam"
-      - lesson: the new lesson (added / changed) or the old lesson (removed)
-      - before: previous lesson state  (only for "changed")
-      - after:  new lesson state        (only for "changed")
+      - type:   "added" | "removed" | "changed" | "exam" | "moved"
+      - lesson: the new lesson (added / changed / moved) or the old lesson (removed)
+      - before: previous lesson state  (only for "changed", "exam" and "moved")
+      - after:  new lesson state        (only for "changed", "exam" and "moved")
+      - fields_changed: {field: {"before": ..., "after": ...}} for the fields
+        that differ, id excluded (only where before/after are present)
+
+    "moved" pairs a removed and an added lesson (different or missing IDs)
+    on the same date with the same subjects and teachers, e.g. a lesson
+    WebUntis shifted to another period under a new ID.
     """
-    old_by_id = _index_lessons_by_id(old)
-    new_by_id = _index_lessons_by_id(new)
+    old = old if isinstance(old, PreparedTimetable) else prepare(old)
+    new = new if isinstance(new, PreparedTimetable) else prepare(new)
+    if days is None:
+        if old.root == new.root:
+            return []
+        days = changed_days(old.day_hashes, new.day_hashes)
+    old_by_id = old.index_on_days(days)
+    new_by_id = new.index_on_days(days)
 
     changes = []
 
-    for lid, lesson in new_by_id.items():
-        if lid not in old_by_id:
-            changes.append({"type": "added", "lesson": lesson})
+    added = [lesson for lid, lesson in new_by_id.items() if lid not in old_by_id]
+    removed = [lesson for lid, lesson in old_by_id.items() if lid not in new_by_id]
+    moved = _match_moves(removed, added) if added and removed else []
+    if moved:
+        moved_ids = {id(lesson) for pair in moved for lesson in pair}
+        added = [lesson for lesson in added if id(lesson) not in moved_ids]
+        removed = [lesson for lesson in removed if id(lesson) not in moved_ids]
+
+    for lesson in added:
+        changes.append({"type": "added", "lesson": lesson})
+
+    for lesson in removed:
+        changes.append({"type": "removed", "lesson": lesson})
 
-    for lid, lesson in old_by_id.items():
-        if lid not in new_by_id:
-            changes.append({"type": "removed", "lesson": lesson})
+    for before, after in moved:
+        changed = fields_changed(before, after)
+        # A new ID alone is not a change anyone needs to hear about.
+        if changed:
+            changes.append(_change_record("moved", before, after, changed))
 
     for lid in sorted(old_by_id.keys() & new_by_id.keys()):
+        if old.fingerprints[lid] == new.fingerprints[lid]:
+            continue
         before = old_by_id[lid]
         after = new_by_id[lid]
-        if before != after:
+        changed = fields_changed(before, after)
+        # Fingerprints also differ for equal values serialised differently (1 vs 1.0).
+        if changed:
             change_type = "exam" if after.get("change_type") == "exam" and before.get("change_type") != "exam" else "changed"
-            changes.append({
-                "type": change_type,
-                "lesson": after,
-                "before": before,
-                "after": after,
-            })
+            changes.append(_change_record(change_type, before, after, changed))
 
     return changes
+
+
+def find_changes_many(
+    batch: Iterable[tuple[Hashable, list[dict] | PreparedTimetable | None, list[dict] | PreparedTimetable | None]],
+    *,
+    max_workers: int = 0,
+) -> dict[Hashable, list[dict]]:
+    """
+    Diff many (key, old, new) snapshot pairs at once and return {key: changes}
+    in batch order; keys must be unique. Raw lists are prepared together with
+    prepare_many() and pairs with equal root hashes skip the lesson diff.
+
+    With max_workers > 1 and at least _POOL_MIN_BATCH pairs, the batch is
+    split across a process pool and each process diffs its share. Prepared
+    sides are pickled to the workers as they are; raw lists are prepared there.
+    """
+    batch = list(batch)
+    if max_workers > 1 and len(batch) >= _POOL_MIN_BATCH:
+        workers = min(max_workers, len(batch))
+        results: dict[Hashable, list[dict]] = {}
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for chunk_changes in pool.map(find_changes_many, [batch[i::workers] for i in range(workers)]):
+                results.update(chunk_changes)
+        return {key: results[key] for key, _, _ in batch}
+
+    raw = [side for _, old, new in batch for side in (old, new) if not isinstance(side, PreparedTimetable)]
+    prepared = iter(prepare_many(raw))
+    results = {}
+    for key, old, new in batch:
+        old = old if isinstance(old, PreparedTimetable) else next(prepared)
+        new = new if isinstance(new, PreparedTimetable) else next(prepared)
+        results[key] = [] if old.root == new.root else find_changes(old, new)
+    return results
+
+
+def is_cancelled(lesson: Mapping | None) -> bool:
+    """Return True if the lesson's code or change_type signals a cancellation."""
+    if not lesson:
+        return False
+    code = str(lesson.get("code") or "").lower()
+    change_type = str(lesson.get("change_type") or "").lower()
+    return code in _CANCELLED_VALUES or change_type in _CANCELLED_VALUES
+
+
+def _change_key(change: Mapping) -> str:
+    """Key a change by its lesson: the lesson ID, or start and subjects without one."""
+    lesson = change.get("lesson") or {}
+    lesson_id = _normalise_lesson_id(lesson.get("id"))
+    if lesson_id is not None:
+        return f"id:{lesson_id}"
+    return f"missing:{_start_of(lesson)}:{_serialise(lesson.get('subjects') or [])}"
+
+
+def _change_states(change: Mapping) -> tuple[dict | None, dict | None]:
+    """Return the lesson before and after a change (None where it did not exist)."""
+    if change["type"] == "added":
+        return None, change["lesson"]
+    if change["type"] == "removed":
+        return change["lesson"], None
+    return change["before"], change["after"]
+
+
+def _merge_changes(first: Mapping, latest: Mapping) -> dict | None:
+    """Combine two successive changes of one lesson; None if the lesson is back where it started."""
+    before, _ = _change_states(first)
+    _, after = _change_states(latest)
+    if before is None and after is None:
+        return None
+    if before is None:
+        return {"type": "added", "lesson": after}
+    if after is None:
+        return {"type": "removed", "lesson": before}
+    changed = fields_changed(before, after)
+    if not changed:
+        return None
+    if after.get("change_type") == "exam" and before.get("change_type") != "exam":
+        change_type = "exam"
+    elif "moved" in (first["type"], latest["type"]):
+        change_type = "moved"
+    else:
+        change_type = "changed"
+    return _change_record(change_type, before, after, changed)
+
+
+def _is_urgent(change: Mapping, now: float, horizon: float) -> bool:
+    """Exams and cancellations of lessons starting within horizon seconds skip the hold."""
+    before, after = _change_states(change)
+    if change["type"] != "exam" and not (after is None or (is_cancelled(after) and not is_cancelled(before))):
+        return False
+    try:
+        starts = datetime.fromisoformat(_start_of(change["lesson"])).timestamp()
+    except ValueError:
+        return True
+    return starts - now <= horizon
+
+
+def stabilise(
+    held: dict[str, dict],
+    changes: list[dict],
+    now: float,
+    *,
+    min_polls: int,
+    min_age: float = 0,
+    urgent_horizon: float = 0,
+) -> list[dict]:
+    """
+    Hold per-lesson changes until they have lasted min_polls polls (call once
+    per poll, with changes=[] when nothing new was diffed) and, if min_age > 0,
+    min_age seconds. A lesson that flips back before then is dropped, and
+    successive flips of one lesson are merged into a single change whose
+    hold restarts whenever the lesson lands in a new state. Exams and
+    cancellations starting within urgent_horizon seconds are never held.
+
+    held is updated in place and stays JSON-serialisable so it can be
+    persisted; returns the changes to report now. With min_polls <= 1 and
+    min_age <= 0 nothing is held.
+    """
+    holding = min_polls > 1 or min_age > 0
+    released = []
+    for change in changes:
+        key = _change_key(change)
+        entry = held.get(key)
+        if entry is not None:
+            change = _merge_changes(entry["change"], change)
+            if change is None:
+                del held[key]
+                continue
+            if _change_states(change)[1] != _change_states(entry["change"])[1]:
+                # The lesson moved on to yet another state: it has to settle there afresh
+                entry["since"], entry["polls"] = now, 0
+            entry["change"] = change
+        elif holding and not _is_urgent(change, now, urgent_horizon):
+            held[key] = {"change": change, "since": now, "polls": 0}
+        else:
+            released.append(change)
+
+    for key, entry in list(held.items()):
+        entry["polls"] += 1
+        settled = entry["polls"] >= min_polls and (min_age <= 0 or now - entry["since"] >= min_age)
+        if settled or _is_urgent(entry["change"], now, urgent_horizon):
+            released.append(entry["change"])
+            del held[key]
+    return released
@@ -0,0 +1,107 @@
+"""
+lesson.py – Compact in-memory representation of one normalised lesson.
+
+timetable._normalise_period() returns Lesson objects instead of dicts. A Lesson
+has one slot per field, keeps subjects/teachers/rooms as tuples and interns
+every string, so the same teacher, room or start time is stored once no
+matter how many lessons, weeks or watched elements refer to it.
+
+Lesson is a read-only Mapping, so code written against lesson dicts
+(lesson["start"], lesson.get("rooms")) keeps working. Use to_dict() for JSON
+(storage does this for state.json) and from_dict()/compact() to turn stored
+dicts back into Lessons.
+"""
+
+import sys
+from collections.abc import Mapping
+from typing import Any, Iterator
+
+# Field order matches the dicts written to state.json
+FIELDS = ("id", "start", "end", "subjects", "teachers", "rooms", "code", "change_type")
+_FIELD_SET = frozenset(FIELDS)
+_NAME_FIELDS = ("subjects", "teachers", "rooms")
+
+
+def _intern(value: Any) -> Any:
+    return sys.intern(value) if type(value) is str else value
+
+
+def _names(value: Any) -> tuple:
+    if not value:
+        return ()
+    return tuple(_intern(name) for name in value)
+
+
+class Lesson(Mapping):
+    """One lesson: a slotted, immutable mapping with the keys in FIELDS."""
+
+    __slots__ = FIELDS
+
+    def __init__(
+        self,
+        id: Any,
+        start: str | None,
+        end: str | None,
+        subjects: Any = (),
+        teachers: Any = (),
+        rooms: Any = (),
+        code: str | None = None,
+        change_type: str | None = None,
+    ) -> None:
+        setattr_ = object.__setattr__
+        setattr_(self, "id", _intern(id))
+        setattr_(self, "start", _intern(start))
+        setattr_(self, "end", _intern(end))
+        setattr_(self, "subjects", _names(subjects))
+        setattr_(self, "teachers", _names(teachers))
+        setattr_(self, "rooms", _names(rooms))
+        setattr_(self, "code", _intern(code))
+        setattr_(self, "change_type", _intern(change_type))
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("Lesson is immutable")
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in _FIELD_SET:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(FIELDS)
+
+    def __len__(self) -> int:
+        return len(FIELDS)
+
+    def __repr__(self) -> str:
+        return f"Lesson({', '.join(f'{field}={getattr(self, field)!r}' for field in FIELDS)})"
+
+    def __reduce__(self) -> tuple:
+        return Lesson, tuple(getattr(self, field) for field in FIELDS)
+
+    @classmethod
+    def from_dict(cls, lesson: Mapping) -> "Lesson":
+        return cls(**{field: lesson.get(field) for field in FIELDS})
+
+    def to_dict(self) -> dict[str, Any]:
+        """Return the plain dict form used in state.json (name tuples become lists)."""
+        return {
+            field: list(getattr(self, field)) if field in _NAME_FIELDS else getattr(self, field)
+            for field in FIELDS
+        }
+
+
+def _fits(lesson: Any) -> bool:
+    return (
+        isinstance(lesson, dict)
+        and lesson.keys() == _FIELD_SET
+        and all(isinstance(lesson[field], list) for field in _NAME_FIELDS)
+    )
+
+
+def compact(tt: list | None) -> list:
+    """
+    Convert stored lesson dicts to Lessons. Entries a Lesson cannot round-trip
+    exactly are left as dicts, so nothing in an older state.json is lost.
+    """
+    return [Lesson.from_dict(lesson) if _fits(lesson) else lesson for lesson in tt or []]
+
@@ -12,10 +12,13 @@ Useful for verifying that Telegram notifications are working correctly.
 import argparse
 import importlib.util
 import logging
+import multiprocessing
 import os
 import platform
 import threading
 import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
 
 
 def _tray_dependencies_available() -> bool:
@@ -33,9 +36,13 @@ import config
 import ai
 import detector
 import health
+import lesson
+import masterdata
 import notifier
+import scheduler
 import storage
 import timetable
+import timetable_async
 
 
 logging.basicConfig(
@@ -44,6 +51,8 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S",
 )
 logger = logging.getLogger("untis-watcher")
+# httpx (ASYNC_FETCH) logs every request at INFO
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
 _stop_event = threading.Event()
 
@@ -54,6 +63,22 @@ _health = health.HealthMonitor(
 
 _WATCHDOG_MULTIPLIER = 3
 
+_scheduler = scheduler.PollScheduler(
+    intervals={
+        "active": config.POLL_INTERVAL_ACTIVE,
+        "day": config.POLL_INTERVAL,
+        "night": config.POLL_INTERVAL_NIGHT,
+        "weekend": config.POLL_INTERVAL_WEEKEND,
+        "holiday": config.POLL_INTERVAL_HOLIDAY,
+    },
+    active_lead_s=config.POLL_ACTIVE_LEAD,
+    night_hours=(config.POLL_NIGHT_START, config.POLL_NIGHT_END),
+)
+
+_fetch_tiers = scheduler.FetchTiers(
+    max_ages={"week": config.FETCH_TIER_WEEK_MAX_AGE, "full": config.FETCH_TIER_FULL_MAX_AGE},
+)
+
 
 class LoginFailedError(ConnectionError):
     pass
@@ -85,8 +110,18 @@ def _log_startup_config() -> None:
     logger.info("[config] Untis school  : %s", config.UNTIS_SCHOOL or "(not set)")
     logger.info("[config] Untis user    : %s", config.UNTIS_USER or "(not set)")
     logger.info("[config] Element ID    : %s  type: %s", config.UNTIS_ELEMENT_ID, config.UNTIS_ELEMENT_TYPE)
+    if config.UNTIS_ELEMENTS:
+        logger.info("[config] Watching     : %s", ", ".join(element["key"] for element in config.UNTIS_ELEMENTS))
     logger.info("[config] Days ahead    : %s", config.DAYS_AHEAD)
     logger.info("[config] Poll interval : %ss", config.POLL_INTERVAL)
+    logger.info("[config] Cond. fetch   : %s", config.CONDITIONAL_FETCH)
+    logger.info("[config] Adaptive poll : %s", config.ADAPTIVE_POLLING)
+    logger.info("[config] Tiered fetch  : %s", config.TIERED_FETCH)
+    logger.info("[config] Prune past    : %s", f"{config.PAST_LESSON_GRACE}s grace" if config.PRUNE_PAST_LESSONS else False)
+    if config.FLAP_HOLD_POLLS > 1 or config.FLAP_HOLD_SECONDS > 0:
+        logger.info("[config] Flap hold     : %s poll(s) / %ss", config.FLAP_HOLD_POLLS, config.FLAP_HOLD_SECONDS)
+    if config.DIFF_PROCESSES > 1:
+        logger.info("[config] Diff processes: %s", config.DIFF_PROCESSES)
     logger.info("[config] Telegram token: %s", _mask(config.TELEGRAM_TOKEN))
     logger.info("[config] Telegram chat : %s", config.TELEGRAM_CHAT_ID or "(not set)")
     logger.info("[config] AI enabled    : %s", config.AI_ENABLED)
@@ -115,83 +150,376 @@ def _send_startup_greeting() -> None:
         logger.warning("Could not send startup greeting: %s", _sanitize_error(exc))
 
 
-def _load_previous_timetable() -> list[dict]:
-    state = storage.load_state()
-    if not state:
-        logger.info("No state.json found; first successful fetch will become the baseline.")
-        return []
-    previous_timetable = state.get("timetable")
-    if not isinstance(previous_timetable, list):
-        logger.warning("state.json did not contain a timetable list; starting with an empty baseline.")
-        return []
-    normalised_count = len(detector.normalise_timetable(previous_timetable))
-    logger.info("Loaded state.json baseline with %s normalised lesson(s).", normalised_count)
-    return previous_timetable
+@dataclass
+class _Watch:
+    """One watched element (own timetable, class, teacher or room) and its baseline."""
+    key: str
+    element: dict | None
+    chat_id: str
+    timetable: list[dict] = field(default_factory=list)
+    import_marker: dict | None = None
+    # fetch tier -> digest of the raw response the matching baseline segment came from
+    digests: dict[str, str] = field(default_factory=dict)
+    # ISO date -> hash of that day's normalised lessons (see detector.PreparedTimetable)
+    day_hashes: dict[str, str] = field(default_factory=dict)
+    # timetable, normalised once and carried across cycles; None until a diff needs it
+    baseline: detector.PreparedTimetable | None = None
+    # lesson key -> change waiting to settle (see detector.stabilise)
+    held: dict[str, dict] = field(default_factory=dict)
 
 
-def _login_with_retry() -> object:
-    last_error: Exception | None = None
-    for attempt in range(1, 3):
-        try:
-            session = timetable.get_session()
-            logger.info("Login successful on attempt %s.", attempt)
-            return session
-        except Exception as exc:
-            last_error = exc
-            logger.warning("Login failed on attempt %s/2: %s", attempt, _sanitize_error(exc))
-            if attempt == 1:
-                time.sleep(2)
-    raise LoginFailedError("WebUntis login failed after 2 attempts.") from last_error
+_OWN_TIMETABLE_KEY = "self"
 
 
-def _fetch_current_timetable(session: object) -> list[dict]:
+def _legacy_state_key(watches: list[_Watch]) -> str | None:
+    """
+    Return the watch that inherits a version 1 state.json, which holds the logged-in
+    user's own timetable: the own-timetable watch, or the UNTIS_ELEMENTS entry for
+    UNTIS_ELEMENT_TYPE/UNTIS_ELEMENT_ID. None drops it; the first fetch becomes the baseline.
+    """
+    own_key = f"{config.UNTIS_ELEMENT_TYPE}:{config.UNTIS_ELEMENT_ID}"
+    for watch in watches:
+        if watch.element is None or watch.key == own_key:
+            return watch.key
+    return None
+
+
+def _load_watches() -> list[_Watch]:
+    if config.UNTIS_ELEMENTS:
+        watches = [_Watch(key=element["key"], element=element, chat_id=element["chat_id"])
+                   for element in config.UNTIS_ELEMENTS]
+    else:
+        watches = [_Watch(key=_OWN_TIMETABLE_KEY, element=None, chat_id=config.TELEGRAM_CHAT_ID)]
+
+    stored = storage.load_elements(default_key=_legacy_state_key(watches))
+    if not stored:
+        logger.info("No usable state.json found; first successful fetch will become the baseline.")
+
+    for watch in watches:
+        entry = stored.get(watch.key) or {}
+        previous_timetable = entry.get("timetable")
+        if not isinstance(previous_timetable, list):
+            if stored:
+                logger.info("[%s] No baseline in state.json; next fetch will become the baseline.", watch.key)
+            continue
+        import_marker = entry.get("import_marker")
+        digests = entry.get("digests")
+        day_hashes = entry.get("day_hashes")
+        held = entry.get("held_changes")
+        watch.timetable = lesson.compact(previous_timetable)
+        watch.import_marker = import_marker if isinstance(import_marker, dict) else None
+        watch.digests = digests if isinstance(digests, dict) else {}
+        watch.held = held if isinstance(held, dict) else {}
+        if isinstance(day_hashes, dict):
+            # Only days whose hash changes get normalised, on demand.
+            watch.day_hashes = day_hashes
+        else:
+            watch.baseline = detector.prepare(previous_timetable)
+            watch.day_hashes = watch.baseline.day_hashes
+        logger.info("[%s] Loaded state.json baseline with %s lesson(s) on %s day(s).",
+                    watch.key, len(watch.timetable), len(watch.day_hashes))
+    return watches
+
+
+def _save_watches(watches: list[_Watch]) -> None:
+    storage.save_elements(
+        {
+            watch.key: {
+                "timetable": watch.timetable,
+                "import_marker": watch.import_marker,
+                "digests": watch.digests,
+                "day_hashes": watch.day_hashes,
+                "held_changes": watch.held,
+            }
+            for watch in watches
+        },
+        snapshot_every=config.STATE_SNAPSHOT_EVERY,
+        compact_interval=config.STATE_COMPACT_INTERVAL,
+    )
+
+
+def _login() -> object:
+    """Log in once; backoff.DEFAULT_POLICY already retries the authenticate call on transient errors."""
     try:
-        current_timetable = timetable.fetch(session)
+        session = timetable.get_session()
+    except Exception as exc:
+        logger.warning("Login failed: %s", _sanitize_error(exc))
+        raise LoginFailedError("WebUntis login failed.") from exc
+    logger.info("Login successful.")
+    return session
+
+
+_sessions = timetable.SessionManager(login=_login)
+
+
+def _current_import_marker(session: object) -> dict | None:
+    """Return the WebUntis import time and fetch window the next fetch would reflect."""
+    import_time = timetable.get_latest_import_time(session)
+    if import_time is None:
+        return None
+    window_start, _ = timetable.fetch_window()
+    return {"import_time": import_time, "window_start": window_start.isoformat()}
+
+
+def _fetch_current_timetables(
+    session: object,
+    watches: list[_Watch],
+    import_marker: dict | None,
+    tier: str,
+    window: tuple | None = None,
+) -> list[timetable.FetchResult]:
+    try:
+        lookups = masterdata.get_lookups(session, import_marker["import_time"] if import_marker else None)
+        fetch_many_results = (
+            timetable_async.run_fetch_many_results if config.ASYNC_FETCH else timetable.fetch_many_results
+        )
+        results = fetch_many_results(
+            session,
+            [watch.element for watch in watches],
+            lookups=lookups,
+            window=window,
+            previous_digests=[watch.digests.get(tier) for watch in watches],
+        )
     except Exception:
         logger.exception("Fetch failed; state.json will not be overwritten.")
         raise
-    logger.info("Fetch successful with %s lesson(s).", len(current_timetable))
-    return current_timetable
-
-
-def _notify_changes(previous_timetable: list[dict], current_timetable: list[dict], changes: list[dict]) -> None:
+    stale_lookups = sorted({kind for result in results for kind in result.stale_lookups})
+    if stale_lookups:
+        logger.info("Master data is missing %s entries; it will be refreshed before the next fetch.",
+                    "/".join(stale_lookups))
+        masterdata.invalidate()
+    for watch, result in zip(watches, results):
+        if result.lessons is None:
+            logger.info("[%s] Fetch successful; raw response identical to the baseline's.", watch.key)
+        else:
+            logger.info("[%s] Fetch successful with %s lesson(s).", watch.key, len(result.lessons))
+    return results
+
+
+def _notify_changes(
+    watch: _Watch,
+    previous_timetable: list[dict],
+    current_timetable: list[dict],
+    changes: list[dict],
+) -> None:
     summary = ai.explain(previous_timetable, current_timetable, changes)
+    if watch.element is not None and len(config.UNTIS_ELEMENTS) > 1:
+        summary = f"[{watch.key}] {summary}"
     logger.info("Summary generated: %s%s", summary[:80], "…" if len(summary) > 80 else "")
     try:
-        notifier.send(summary)
+        notifier.send(summary, chat_id=watch.chat_id)
         logger.info("Telegram notification sent.")
     except Exception as exc:
         logger.error("Notification failed: %s", _sanitize_error(exc))
 
 
-def _process_once(previous_timetable: list[dict]) -> tuple[list[dict], str, int]:
-    session = _login_with_retry()
-    try:
-        current_timetable = _fetch_current_timetable(session)
-    finally:
-        timetable.logout(session)
-
-    previous_normalised = detector.normalise_timetable(previous_timetable)
-    current_normalised = detector.normalise_timetable(current_timetable)
-
-    outcome: str = "ok"
-    change_count: int = 0
-
-    if not previous_normalised:
-        logger.info("No previous timetable baseline; saving current state without notification.")
-    elif previous_normalised != current_normalised:
-        changes = detector.find_changes(previous_timetable, current_timetable)
-        change_count = len(changes)
-        logger.info("Diff detected with %s change(s): %s", change_count, ", ".join(c["type"] for c in changes))
-        _notify_changes(previous_timetable, current_timetable, changes)
-        outcome = "changed"
+def _changed_sides(
+    watch: _Watch,
+    current: detector.PreparedTimetable,
+    window: tuple | None,
+) -> tuple[detector.PreparedTimetable, detector.PreparedTimetable] | None:
+    """
+    Compare one fetched window with the same window of the watch's baseline:
+    root hashes first, then day hashes. Return both sides' lessons on the
+    changed days, or None when every day matches.
+    """
+    stored = watch.day_hashes if window is None else detector.day_hashes_within(watch.day_hashes, *window)
+    if detector.root_hash(stored) == current.root:
+        return None
+    days = detector.changed_days(stored, current.day_hashes)
+    if watch.baseline is not None:
+        previous = watch.baseline.select_days(days)
+    else:
+        previous = detector.prepare(detector.lessons_on_days(watch.timetable, days))
+    return previous, current.select_days(days)
+
+
+def _diff_watches(
+    fetched: list[tuple[_Watch, detector.PreparedTimetable]],
+    window: tuple | None,
+) -> dict[str, list[dict]]:
+    """Diff every fetched window against its watch's baseline in one detector batch."""
+    sides = {}
+    for watch, current in fetched:
+        if watch.timetable:
+            changed = _changed_sides(watch, current, window)
+            if changed is not None:
+                sides[watch.key] = changed
+    changes_by_key = detector.find_changes_many(
+        [(key, previous, current) for key, (previous, current) in sides.items()],
+        max_workers=config.DIFF_PROCESSES,
+    )
+
+    for watch, _ in fetched:
+        changes = changes_by_key.get(watch.key)
+        if not watch.timetable:
+            logger.info("[%s] No previous timetable baseline; saving current state without notification.", watch.key)
+        elif changes:
+            previous, current = sides[watch.key]
+            logger.info("[%s] Diff detected on %s day(s) with %s change(s): %s",
+                        watch.key, len(current.day_hashes.keys() | previous.day_hashes.keys()),
+                        len(changes), ", ".join(c["type"] for c in changes))
+        else:
+            logger.info("[%s] No change detected; normalised timetable matches persisted state.", watch.key)
+    return changes_by_key
+
+
+def _report_changes(
+    watches: list[_Watch],
+    changes_by_key: dict[str, list[dict]],
+    current_timetables: dict[str, list[dict]],
+) -> tuple[int, bool]:
+    """
+    Pass each watch's new changes through flap suppression and notify the ones
+    that are released. Returns (changes notified, whether any held change moved).
+    """
+    now = time.time()
+    notified = 0
+    held_changed = False
+    for watch in watches:
+        changes = changes_by_key.get(watch.key, [])
+        if not changes and not watch.held:
+            continue
+        had_held = bool(watch.held)
+        released = detector.stabilise(
+            watch.held,
+            changes,
+            now,
+            min_polls=config.FLAP_HOLD_POLLS,
+            min_age=config.FLAP_HOLD_SECONDS,
+            urgent_horizon=config.FLAP_URGENT_HORIZON,
+        )
+        held_changed = held_changed or had_held or bool(watch.held)
+        if watch.held:
+            logger.info("[%s] Holding %s change(s) until they settle.", watch.key, len(watch.held))
+        if released:
+            current_timetable = current_timetables.get(watch.key, watch.timetable)
+            _notify_changes(watch, watch.timetable, current_timetable, released)
+            notified += len(released)
+    return notified, held_changed
+
+
+def _update_baseline(
+    watch: _Watch,
+    current_timetable: list[dict],
+    current: detector.PreparedTimetable,
+    window: tuple | None,
+) -> None:
+    """Make the fetched window the watch's new baseline (the whole baseline after a full fetch)."""
+    if window is None:
+        watch.timetable = current_timetable
+        watch.baseline = current
+        watch.day_hashes = current.day_hashes
+        return
+    untouched = detector.split_by_window(watch.timetable, *window)[1]
+    watch.timetable = sorted(untouched + current_timetable, key=lambda lesson: str(lesson.get("start") or ""))
+    if watch.baseline is not None:
+        watch.baseline = watch.baseline.replace_window(*window, current)
+    inside = detector.day_hashes_within(watch.day_hashes, *window)
+    watch.day_hashes = {
+        **{day: day_hash for day, day_hash in watch.day_hashes.items() if day not in inside},
+        **current.day_hashes,
+    }
+
+
+def _past_cutoff() -> str | None:
+    """Return the local time before which finished lessons are dropped, or None if pruning is off."""
+    if not config.PRUNE_PAST_LESSONS:
+        return None
+    return (datetime.now() - timedelta(seconds=config.PAST_LESSON_GRACE)).strftime("%Y-%m-%dT%H:%M")
+
+
+def _prune_past(watch: _Watch, cutoff: str) -> bool:
+    """Drop baseline lessons that ended before cutoff, keeping the day hashes in step."""
+    kept = detector.drop_past(watch.timetable, cutoff)
+    if len(kept) == len(watch.timetable):
+        return False
+    kept_ids = {id(lesson) for lesson in kept}
+    touched = sorted({str(lesson.get("start") or "")[:10] for lesson in watch.timetable if id(lesson) not in kept_ids})
+    watch.timetable = kept
+    if watch.baseline is not None:
+        watch.baseline = watch.baseline.drop_past(cutoff)
+        watch.day_hashes = watch.baseline.day_hashes
     else:
-        logger.info("No change detected; normalised timetable matches persisted state.")
-        outcome = "no_change"
+        rehashed = detector.prepare(detector.lessons_on_days(kept, touched)).day_hashes
+        watch.day_hashes = {
+            **{day: day_hash for day, day_hash in watch.day_hashes.items() if day not in touched},
+            **rehashed,
+        }
+    logger.info("[%s] Dropped lessons that ended before %s from the baseline.", watch.key, cutoff)
+    return True
+
+
+def _next_fetch_tier(watches: list[_Watch]) -> scheduler.FetchTier:
+    """Return which window to fetch; watches without a baseline always get the full window."""
+    if not config.TIERED_FETCH or any(not watch.timetable for watch in watches):
+        return "full"
+    return _fetch_tiers.due(timetable.fetch_window()[0], time.time())
+
+
+def _process_once(watches: list[_Watch]) -> tuple[str, int]:
+    current_marker = _sessions.call(_current_import_marker) if config.CONDITIONAL_FETCH else None
+    if config.ADAPTIVE_POLLING:
+        import_time = current_marker["import_time"] if current_marker else None
+        _scheduler.update_calendar(_sessions.call(masterdata.get_calendar, import_time))
+
+    cutoff = _past_cutoff()
+    pruned = cutoff is not None and any([_prune_past(watch, cutoff) for watch in watches if watch.timetable])
+
+    stale = [
+        watch for watch in watches
+        if not watch.timetable or current_marker is None or current_marker != watch.import_marker
+    ]
+    if not stale:
+        logger.info("No new WebUntis import since the baselines were fetched; skipping getTimetable.")
+        notified, held_changed = _report_changes(watches, {}, {})
+        if pruned or held_changed:
+            _save_watches(watches)
+        return ("changed", notified) if notified else ("no_change", 0)
+
+    tier = _next_fetch_tier(stale)
+    window = None if tier == "full" else timetable.tier_window(tier)
+    if window:
+        logger.info("Tiered fetch: refreshing the %s window only (%s to %s).",
+                    tier, window[0].isoformat(), window[1].isoformat())
+    results = _sessions.call(_fetch_current_timetables, stale, current_marker, tier, window)
+    _fetch_tiers.mark_fetched(tier, timetable.fetch_window()[0], time.time())
+
+    state_changed = pruned
+    fetched: list[tuple[_Watch, timetable.FetchResult, list[dict]]] = []
+    for watch, result in zip(stale, results):
+        if window is None and watch.import_marker != current_marker:
+            watch.import_marker = current_marker
+            state_changed = True
+        # lessons is None for the same bytes as the response this segment of the baseline was built from.
+        if result.lessons is not None:
+            lessons = result.lessons if cutoff is None else detector.drop_past(result.lessons, cutoff)
+            fetched.append((watch, result, lessons))
+
+    # One batch, so lessons shared between elements are normalised once.
+    currents = detector.prepare_many([lessons for _, _, lessons in fetched])
+    changes_by_key = _diff_watches([(watch, current) for (watch, _, _), current in zip(fetched, currents)], window)
+    notified, held_changed = _report_changes(
+        watches, changes_by_key, {watch.key: lessons for watch, _, lessons in fetched}
+    )
+    has_new_baseline = any(not watch.timetable for watch, _, _ in fetched)
+    for (watch, result, lessons), current in zip(fetched, currents):
+        state_changed = True
+        # The baseline changes here, so digests of other tiers no longer describe it.
+        watch.digests = {tier: result.digest} if result.digest else {}
+        _update_baseline(watch, lessons, current, window)
+
+    if state_changed or held_changed:
+        _save_watches(watches)
+        logger.info("State saved with latest fetched data.")
+    else:
+        logger.info("All responses unchanged; state left as is.")
 
-    storage.save_state(current_timetable)
-    logger.info("state.json overwritten with latest fetched data.")
-    return current_timetable, outcome, change_count
+    if notified:
+        return "changed", notified
+    if has_new_baseline:
+        return "ok", 0
+    return "no_change", 0
 
 
 def run_test_notification() -> None:
@@ -223,6 +551,7 @@ def run_test_notification() -> None:
             "lesson": fake_after,
             "before": fake_before,
             "after": fake_after,
+            "fields_changed": detector.fields_changed(fake_before, fake_after),
         },
         {
             "type": "removed",
@@ -249,7 +578,8 @@ def poll_loop() -> None:
     logger.info("untis-watcher starting up …")
     _log_startup_config()
     _send_startup_greeting()
-    previous_timetable = _load_previous_timetable()
+    timetable.start_token_refresher()
+    watches = _load_watches()
 
     while not _stop_event.is_set():
         cycle_start = time.time()
@@ -258,7 +588,7 @@ def poll_loop() -> None:
         error_str: str = ""
 
         try:
-            previous_timetable, outcome, change_count = _process_once(previous_timetable)
+            outcome, change_count = _process_once(watches)
         except LoginFailedError as exc:
             error_str = _sanitize_error(exc)
             outcome = "login_error"
@@ -286,17 +616,24 @@ def poll_loop() -> None:
                     send_alert_fn=notifier.send,
                 )
 
+        interval = config.POLL_INTERVAL
+        if config.ADAPTIVE_POLLING:
+            mode, interval = _scheduler.next_interval([lesson for watch in watches for lesson in watch.timetable])
+            logger.info("Next poll in %ss (%s mode).", interval, mode)
+
         _health.check_watchdog(
-            silence_threshold_s=_WATCHDOG_MULTIPLIER * config.POLL_INTERVAL,
+            silence_threshold_s=_WATCHDOG_MULTIPLIER * max(config.POLL_INTERVAL, interval),
             send_alert_fn=notifier.send,
         )
         _health.maybe_send_heartbeat(send_fn=notifier.send)
 
-        for _ in range(config.POLL_INTERVAL):
+        for _ in range(interval):
             if _stop_event.is_set():
                 break
             time.sleep(1)
 
+    _sessions.close()
+    timetable.stop_token_refresher()
     logger.info("Untis Watcher stopped.")
 
 
@@ -306,6 +643,8 @@ def on_quit(icon, item):
 
 
 def main() -> None:
+    # DIFF_PROCESSES workers re-run the frozen exe; this hands them to the pool instead of starting another watcher
+    multiprocessing.freeze_support()
     parser = argparse.ArgumentParser(description="Untis Watcher")
     parser.add_argument(
         "--test",
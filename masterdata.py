@@ -0,0 +1,179 @@
+"""
+masterdata.py – Disk-backed cache of WebUntis master data (subjects, teachers,
+rooms and classes) used to resolve the IDs in getTimetable responses, plus the
+school calendar (holidays and timegrid) used by the adaptive poll scheduler.
+
+Entries expire after MASTERDATA_TTL seconds, as soon as WebUntis reports a
+newer import than the one the cache was built at, or once a fetch meets an ID
+the cache does not know (see invalidate()). Kinds the account is not allowed
+to read (students often cannot call getTeachers) are cached as unavailable,
+and fetch() keeps asking getTimetable for their names inline.
+"""
+
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any
+
+import requests
+
+from config import MASTERDATA_TTL
+from timetable import SessionExpiredError, _jsonrpc_request, _lookup_by_id
+
+logger = logging.getLogger("untis-watcher")
+
+_CACHE_FILE = Path(__file__).parent / "masterdata.json"
+
+# lookup kind -> JSON-RPC method returning that master data
+_MASTER_DATA_METHODS = {
+    "subjects": "getSubjects",
+    "teachers": "getTeachers",
+    "rooms": "getRooms",
+    "klassen": "getKlassen",
+}
+
+_cache: dict[str, Any] | None = None
+
+
+def _untis_date(value: Any) -> str:
+    """Convert a WebUntis yyyymmdd int to an ISO date string."""
+    text = str(value)
+    return f"{text[:4]}-{text[4:6]}-{text[6:8]}"
+
+
+def _untis_time(value: Any) -> str:
+    """Convert a WebUntis HHMM int to HH:MM."""
+    text = str(value).zfill(4)
+    return f"{text[:2]}:{text[2:4]}"
+
+
+def _download_calendar(session: requests.Session) -> dict[str, Any]:
+    """Return {"holidays": [[start, end], ...], "timegrid": {weekday: [[start, end], ...]}}."""
+    calendar: dict[str, Any] = {"holidays": [], "timegrid": {}}
+    try:
+        holidays = _jsonrpc_request(session, "getHolidays", request_id="getHolidays")
+        timegrid = _jsonrpc_request(session, "getTimegridUnits", request_id="getTimegridUnits")
+    except SessionExpiredError:
+        raise
+    except (ConnectionError, requests.RequestException) as exc:
+        logger.info("[masterdata] School calendar unavailable (%s).", exc)
+        return calendar
+
+    for holiday in holidays if isinstance(holidays, list) else []:
+        if isinstance(holiday, dict) and holiday.get("startDate") and holiday.get("endDate"):
+            calendar["holidays"].append([_untis_date(holiday["startDate"]), _untis_date(holiday["endDate"])])
+
+    for day in timegrid if isinstance(timegrid, list) else []:
+        if not isinstance(day, dict) or not isinstance(day.get("day"), int):
+            continue
+        # WebUntis numbers days 1=Sunday..7=Saturday; store Python weekdays (0=Monday).
+        weekday = str((day["day"] - 2) % 7)
+        calendar["timegrid"][weekday] = [
+            [_untis_time(unit["startTime"]), _untis_time(unit["endTime"])]
+            for unit in day.get("timeUnits") or []
+            if isinstance(unit, dict) and "startTime" in unit and "endTime" in unit
+        ]
+    return calendar
+
+
+def _read_cache_file() -> dict[str, Any] | None:
+    if not _CACHE_FILE.exists():
+        return None
+    try:
+        cached = json.loads(_CACHE_FILE.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        logger.warning("[masterdata] Ignoring unreadable %s.", _CACHE_FILE.name)
+        return None
+    if not isinstance(cached, dict) or not isinstance(cached.get("lookups"), dict):
+        return None
+
+    # JSON object keys are strings; WebUntis IDs are ints.
+    cached["lookups"] = {
+        kind: None if lookup is None else {int(key): name for key, name in lookup.items()}
+        for kind, lookup in cached["lookups"].items()
+    }
+    return cached
+
+
+def _write_cache_file(cached: dict[str, Any]) -> None:
+    temp_file = _CACHE_FILE.with_suffix(".tmp.json")
+    temp_file.write_text(json.dumps(cached, ensure_ascii=False), encoding="utf-8")
+    os.replace(temp_file, _CACHE_FILE)
+
+
+def _is_fresh(cached: dict[str, Any] | None, import_time: int | None) -> bool:
+    if not cached:
+        return False
+    if time.time() - float(cached.get("fetched_at") or 0) >= MASTERDATA_TTL:
+        return False
+    cached_import_time = cached.get("import_time")
+    if import_time is not None and isinstance(cached_import_time, int) and import_time > cached_import_time:
+        return False
+    return set(cached["lookups"]) == set(_MASTER_DATA_METHODS) and isinstance(cached.get("calendar"), dict)
+
+
+def _download(session: requests.Session, import_time: int | None) -> dict[str, Any]:
+    lookups: dict[str, dict[int, str] | None] = {}
+    for kind, method in _MASTER_DATA_METHODS.items():
+        try:
+            lookups[kind] = _lookup_by_id(_jsonrpc_request(session, method, request_id=method))
+        except SessionExpiredError:
+            raise
+        except (ConnectionError, requests.RequestException) as exc:
+            logger.info("[masterdata] %s unavailable (%s); names will be requested inline.", method, exc)
+            lookups[kind] = None
+    logger.info("[masterdata] Refreshed master data: %s.",
+                ", ".join(f"{len(lookup)} {kind}" for kind, lookup in lookups.items() if lookup is not None))
+    return {
+        "fetched_at": time.time(),
+        "import_time": import_time,
+        "lookups": lookups,
+        "calendar": _download_calendar(session),
+    }
+
+
+def _load(session: requests.Session | dict, import_time: int | None) -> dict[str, Any] | None:
+    global _cache
+    if MASTERDATA_TTL <= 0 or (isinstance(session, dict) and session.get("mode") == "rest"):
+        return None
+
+    if _cache is None:
+        _cache = _read_cache_file()
+    if not _is_fresh(_cache, import_time):
+        _cache = _download(session, import_time)
+        try:
+            _write_cache_file(_cache)
+        except OSError as exc:
+            logger.warning("[masterdata] Could not write %s: %s", _CACHE_FILE.name, exc)
+    return _cache
+
+
+def invalidate() -> None:
+    """
+    Treat the cached master data as expired, so the next get_lookups() downloads it again.
+    Called when getTimetable used an ID the cache does not know (e.g. a room added since).
+    """
+    if _cache is not None:
+        _cache["fetched_at"] = 0
+
+
+def get_lookups(session: requests.Session | dict, import_time: int | None = None) -> dict[str, dict[int, str] | None] | None:
+    """
+    Return {kind: {id: name}} lookups for subjects, teachers, rooms and klassen.
+    A kind maps to None when it could not be downloaded. Returns None when the
+    cache is disabled or the session is a REST session.
+    """
+    cached = _load(session, import_time)
+    return cached["lookups"] if cached else None
+
+
+def get_calendar(session: requests.Session | dict, import_time: int | None = None) -> dict[str, Any] | None:
+    """
+    Return the cached school calendar: {"holidays": [[start, end], ...]} with ISO
+    dates and {"timegrid": {weekday: [[HH:MM, HH:MM], ...]}} keyed by Python
+    weekday as a string. Returns None when the cache is disabled or in REST mode.
+    """
+    cached = _load(session, import_time)
+    return cached["calendar"] if cached else None
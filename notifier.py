@@ -8,23 +8,24 @@ from telegram import Bot
 from config import TELEGRAM_TOKEN, TELEGRAM_CHAT_ID
 
 
-async def _send_async(text: str) -> None:
+async def _send_async(text: str, chat_id: str) -> None:
     async with Bot(token=TELEGRAM_TOKEN) as bot:
         await bot.send_message(
-            chat_id=TELEGRAM_CHAT_ID,
+            chat_id=chat_id,
             text=text,
             # parse_mode left as default (plain text) so AI output renders safely
         )
 
 
-def send(text: str) -> None:
+def send(text: str, chat_id: str | None = None) -> None:
     """
     Prepend the 📅 calendar emoji to the overall message and send it.
     Per-item emojis (🔺 cancelled, 🟢 changed, 🟡 exam) are included
     by the AI in its output, so no further prefix logic is needed here.
+    chat_id defaults to TELEGRAM_CHAT_ID.
     """
     if not text or not text.strip():
         return
 
     full_text = f"📅 {text}"
-    asyncio.run(_send_async(full_text))
+    asyncio.run(_send_async(full_text, chat_id or TELEGRAM_CHAT_ID))
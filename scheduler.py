@@ -0,0 +1,181 @@
+"""
+scheduler.py – Adaptive poll intervals driven by the school calendar.
+
+Picks how long the watcher sleeps between polls from the current baseline,
+the cached WebUntis holidays and timegrid, and the clock:
+
+  - active:  from ACTIVE_LEAD seconds before the day's first lesson until its last lesson ends
+  - day:     other daytime hours on a school day
+  - night:   between NIGHT_START and NIGHT_END on a school day
+  - weekend: days without timegrid units (Saturday/Sunday when no timegrid is known)
+  - holiday: days inside a WebUntis holiday
+
+Whatever the mode, the sleep is cut short so the watcher wakes up when the
+next active window opens.
+
+FetchTiers separately decides how much of the timetable a poll requests when
+TIERED_FETCH is on (see timetable.tier_window).
+"""
+
+import logging
+from datetime import date, datetime, time, timedelta
+from typing import Any, Literal
+
+logger = logging.getLogger("untis-watcher")
+
+PollMode = Literal["active", "day", "night", "weekend", "holiday"]
+FetchTier = Literal["near", "week", "full"]
+
+# How many days ahead to look for the next lesson when clamping a long sleep
+_LOOKAHEAD_DAYS = 7
+
+
+def _parse_minute(value: Any) -> datetime | None:
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+class PollScheduler:
+    """
+    Decide the next poll interval.  One instance lives for the process lifetime.
+
+    Usage in main.py::
+
+        scheduler = PollScheduler(intervals={...}, active_lead_s=3600, night_hours=(22, 6))
+        scheduler.update_calendar(masterdata.get_calendar(session))
+        mode, seconds = scheduler.next_interval(lessons)
+    """
+
+    def __init__(
+        self,
+        intervals: dict[PollMode, int],
+        active_lead_s: int = 3600,
+        night_hours: tuple[int, int] = (22, 6),
+    ) -> None:
+        self.intervals = intervals
+        self.active_lead = timedelta(seconds=active_lead_s)
+        self.night_start, self.night_end = night_hours
+        self._holidays: list[tuple[date, date]] = []
+        self._timegrid: dict[int, list[tuple[time, time]]] = {}
+        # Lesson spans seen so far, so lessons pruned once they ended still count
+        self._known_spans: dict[date, tuple[datetime, datetime]] = {}
+
+    def update_calendar(self, calendar: dict[str, Any] | None) -> None:
+        """Replace the holidays and timegrid used for scheduling (see masterdata.get_calendar)."""
+        if not calendar:
+            return
+        self._holidays = [
+            (date.fromisoformat(start), date.fromisoformat(end))
+            for start, end in calendar.get("holidays") or []
+        ]
+        self._timegrid = {
+            int(weekday): [(time.fromisoformat(start), time.fromisoformat(end)) for start, end in units]
+            for weekday, units in (calendar.get("timegrid") or {}).items()
+        }
+
+    # ------------------------------------------------------------------
+    # Calendar helpers
+    # ------------------------------------------------------------------
+
+    def _is_holiday(self, day: date) -> bool:
+        return any(start <= day <= end for start, end in self._holidays)
+
+    def _is_school_day(self, day: date) -> bool:
+        if self._is_holiday(day):
+            return False
+        if self._timegrid:
+            return bool(self._timegrid.get(day.weekday()))
+        return day.weekday() < 5
+
+    def _day_span(self, day: date, lessons_by_day: dict[date, tuple[datetime, datetime]]) -> tuple[datetime, datetime] | None:
+        """Return (first lesson start, last lesson end) for day from the baseline, else from the timegrid."""
+        if day in lessons_by_day:
+            return lessons_by_day[day]
+        units = self._timegrid.get(day.weekday())
+        if units and self._is_school_day(day):
+            return datetime.combine(day, units[0][0]), datetime.combine(day, units[-1][1])
+        return None
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def next_interval(self, lessons: list[dict], now: datetime | None = None) -> tuple[PollMode, int]:
+        """Return the poll mode for now and the number of seconds to sleep."""
+        now = now or datetime.now()
+
+        lessons_by_day: dict[date, tuple[datetime, datetime]] = {}
+        for lesson in lessons:
+            start = _parse_minute(lesson.get("start"))
+            end = _parse_minute(lesson.get("end")) or start
+            if start is None:
+                continue
+            first, last = lessons_by_day.get(start.date(), (start, end))
+            lessons_by_day[start.date()] = (min(first, start), max(last, end))
+
+        today = now.date()
+        for day, (first, last) in list(self._known_spans.items()):
+            if day < today:
+                del self._known_spans[day]
+            elif day in lessons_by_day:
+                lessons_by_day[day] = (min(first, lessons_by_day[day][0]), max(last, lessons_by_day[day][1]))
+        self._known_spans.update({day: span for day, span in lessons_by_day.items() if day >= today})
+        today_span = self._day_span(today, lessons_by_day)
+        next_start = None
+        for offset in range(_LOOKAHEAD_DAYS + 1):
+            span = self._day_span(today + timedelta(days=offset), lessons_by_day)
+            if span and span[0] > now:
+                next_start = span[0]
+                break
+
+        if today_span and today_span[0] - self.active_lead <= now <= today_span[1]:
+            mode: PollMode = "active"
+        elif next_start and next_start - now <= self.active_lead:
+            mode = "active"
+        elif self._is_holiday(today):
+            mode = "holiday"
+        elif not self._is_school_day(today):
+            mode = "weekend"
+        elif now.hour >= self.night_start or now.hour < self.night_end:
+            mode = "night"
+        else:
+            mode = "day"
+
+        seconds = self.intervals[mode]
+        if mode != "active" and next_start:
+            # Wake up in time for the next active window.
+            until_active = int((next_start - self.active_lead - now).total_seconds())
+            seconds = max(1, min(seconds, until_active))
+        return mode, seconds
+
+
+class FetchTiers:
+    """
+    Pick the date window for the next fetch.  "near" (today and tomorrow) is
+    fetched on every poll; "week" and "full" once their max age has passed.
+    A wider tier also refreshes the narrower ones it contains.
+    """
+
+    def __init__(self, max_ages: dict[FetchTier, int]) -> None:
+        self.max_ages = max_ages
+        self._fetched_at: dict[FetchTier, float] = {}
+        self._window_start: date | None = None
+
+    def due(self, window_start: date, now: float) -> FetchTier:
+        """Return the widest tier that is due; the fetch window moving forces "full"."""
+        if window_start != self._window_start:
+            return "full"
+        for tier in ("full", "week"):
+            if now - self._fetched_at.get(tier, float("-inf")) >= self.max_ages[tier]:
+                return tier
+        return "near"
+
+    def mark_fetched(self, tier: FetchTier, window_start: date, now: float) -> None:
+        """Record a successful fetch of tier (and the tiers it contains)."""
+        covered: list[FetchTier] = {"near": ["near"], "week": ["near", "week"], "full": ["near", "week", "full"]}[tier]
+        for name in covered:
+            self._fetched_at[name] = now
+        if tier == "full":
+            self._window_start = window_start
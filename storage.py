@@ -1,16 +1,45 @@
 """
 storage.py – Persist watcher state to disk so the bot survives restarts.
+
+Per-element state is kept as a snapshot in state.json plus an append-only
+state.log: save_elements() appends one JSON line holding only what changed
+since the last write (changed fields, lessons added and dropped) and writes a
+fresh snapshot every so often. load_elements() rebuilds the state from the
+snapshot and the log lines written after it.
 """
 
+import hashlib
 import json
 import os
+import time
+from collections import Counter
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any
 
+from lesson import Lesson
+
 _STATE_FILE = Path(__file__).parent / "state.json"
+_LOG_FILE = Path(__file__).parent / "state.log"
 _LEGACY_TIMETABLE_FILE = Path(__file__).parent / "last_timetable.json"
 _STATE_VERSION = 1
+# Version 2 keeps one baseline per watched element under "elements"
+_ELEMENTS_STATE_VERSION = 2
+
+# What the snapshot plus log on disk currently hold, per element key:
+# {"fields": {field: canonical JSON}, "lessons": Counter of lesson keys}.
+# None until this process has loaded or written a snapshot.
+_persisted: dict[str, dict[str, Any]] | None = None
+_log_seq = 0           # sequence number of the last state.log line
+_log_appends = 0       # state.log lines since the snapshot
+_snapshot_time = 0.0   # time.time() of the snapshot (or of loading it)
+
+
+def _encode(value: Any) -> Any:
+    """json default= hook: write Lessons in the same dict form as before."""
+    if isinstance(value, Lesson):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
 
 
 def _utc_now_iso() -> str:
@@ -48,8 +77,184 @@ def save_state(timetable: list[dict]) -> None:
         "timetable": timetable,
     }
     temp_file = _STATE_FILE.with_suffix(".tmp.json")
-    temp_file.write_text(json.dumps(state, ensure_ascii=False, indent=2, sort_keys=True), encoding="utf-8")
+    temp_file.write_text(json.dumps(state, ensure_ascii=False, indent=2, sort_keys=True, default=_encode), encoding="utf-8")
+    os.replace(temp_file, _STATE_FILE)
+
+
+def _canonical(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=_encode)
+
+
+def _lesson_key(lesson: Any) -> str:
+    """Identify a stored lesson by its exact JSON form."""
+    return hashlib.blake2b(_canonical(lesson).encode(), digest_size=12).hexdigest()
+
+
+def _remember(elements: dict[str, dict[str, Any]]) -> dict[str, dict[str, Any]]:
+    return {
+        key: {
+            "fields": {field: _canonical(value) for field, value in entry.items() if field != "timetable"},
+            "lessons": Counter(_lesson_key(lesson) for lesson in entry.get("timetable") or []),
+        }
+        for key, entry in elements.items()
+    }
+
+
+def _element_delta(persisted: dict[str, Any], entry: dict[str, Any]) -> tuple[dict[str, Any], dict[str, Any]]:
+    """Return (delta to append, what is persisted after it) for one element."""
+    delta: dict[str, Any] = {}
+    fields = {}
+    for field, value in entry.items():
+        if field == "timetable":
+            continue
+        fields[field] = _canonical(value)
+        if persisted["fields"].get(field) != fields[field]:
+            delta[field] = value
+
+    keyed = [(_lesson_key(lesson), lesson) for lesson in entry.get("timetable") or []]
+    lessons = Counter(key for key, _ in keyed)
+    dropped = persisted["lessons"] - lessons
+    added = lessons - persisted["lessons"]
+    if dropped:
+        delta["drop"] = sorted(dropped.elements())
+    if added:
+        delta["add"] = []
+        for key, lesson in keyed:
+            if added[key] > 0:
+                added[key] -= 1
+                delta["add"].append(lesson)
+    return delta, {"fields": fields, "lessons": lessons}
+
+
+def _apply_delta(entry: dict[str, Any], delta: dict[str, Any]) -> dict[str, Any]:
+    entry = {**entry, **{field: value for field, value in delta.items() if field not in ("drop", "add")}}
+    if "drop" in delta or "add" in delta:
+        dropped = Counter(delta.get("drop") or [])
+        kept = []
+        for lesson in entry.get("timetable") or []:
+            key = _lesson_key(lesson)
+            if dropped[key] > 0:
+                dropped[key] -= 1
+            else:
+                kept.append(lesson)
+        entry["timetable"] = sorted(kept + (delta.get("add") or []), key=lambda lesson: str(lesson.get("start") or ""))
+    return entry
+
+
+def _replay_log(elements: dict[str, dict[str, Any]], after_seq: int) -> tuple[int, int]:
+    """
+    Apply state.log lines newer than after_seq to elements; returns (last seq, lines applied).
+    A torn final line from an interrupted append is cut off, so later appends start on a fresh line.
+    """
+    last_seq, applied = after_seq, 0
+    if not _LOG_FILE.exists():
+        return last_seq, applied
+    complete = 0
+    with _LOG_FILE.open("rb") as log:
+        for line in log:
+            try:
+                record = json.loads(line) if line.endswith(b"\n") else None
+            except ValueError:
+                record = None
+            if record is None:
+                break
+            complete += len(line)
+            if record.get("seq", 0) <= after_seq:
+                continue
+            for key, delta in (record.get("elements") or {}).items():
+                elements[key] = _apply_delta(elements.get(key) or {}, delta)
+            last_seq, applied = record["seq"], applied + 1
+    if complete < _LOG_FILE.stat().st_size:
+        with _LOG_FILE.open("r+b") as log:
+            log.truncate(complete)
+    return last_seq, applied
+
+
+def load_elements(default_key: str | None) -> dict[str, dict[str, Any]]:
+    """
+    Return the persisted per-element baselines, keyed by element key: the
+    state.json snapshot with newer state.log lines applied. A version 1 state
+    (one top-level timetable) is returned under default_key, or dropped when
+    default_key is None.
+    """
+    global _persisted, _log_seq, _log_appends, _snapshot_time
+    state = load_state()
+    if not state:
+        return {}
+
+    elements = state.get("elements")
+    if isinstance(elements, dict):
+        elements = {key: entry for key, entry in elements.items() if isinstance(entry, dict)}
+        snapshot_seq = state.get("log_seq", 0)
+        _log_seq, _log_appends = _replay_log(elements, snapshot_seq)
+        _persisted = _remember(elements)
+        _snapshot_time = time.time()
+        return elements
+
+    if isinstance(state.get("timetable"), list):
+        if default_key is None:
+            return {}
+        return {default_key: {key: state[key] for key in ("timetable", "import_marker") if key in state}}
+    return {}
+
+
+def _write_snapshot(elements: dict[str, dict[str, Any]]) -> None:
+    global _persisted, _log_appends, _snapshot_time
+    state = {
+        "version": _ELEMENTS_STATE_VERSION,
+        "updated_at": _utc_now_iso(),
+        "elements": elements,
+        # Log lines up to here are folded in; replay skips them even if state.log survives.
+        "log_seq": _log_seq,
+    }
+    temp_file = _STATE_FILE.with_suffix(".tmp.json")
+    temp_file.write_text(json.dumps(state, ensure_ascii=False, indent=2, sort_keys=True, default=_encode), encoding="utf-8")
     os.replace(temp_file, _STATE_FILE)
+    _LOG_FILE.unlink(missing_ok=True)
+    _persisted = _remember(elements)
+    _log_appends = 0
+    _snapshot_time = time.time()
+
+
+def save_elements(
+    elements: dict[str, dict[str, Any]],
+    *,
+    snapshot_every: int = 0,
+    compact_interval: float = 0,
+) -> None:
+    """
+    Persist every watched element's baseline.
+
+    With snapshot_every <= 0 the whole state is rewritten to state.json each
+    time. Otherwise only what changed since the last write is appended to
+    state.log (nothing at all if nothing changed), and state.json is rewritten
+    and the log cleared after snapshot_every appends, or once compact_interval
+    seconds (if > 0) have passed since the last snapshot.
+    """
+    global _log_seq, _log_appends, _persisted
+    if snapshot_every <= 0 or _persisted is None or elements.keys() != _persisted.keys():
+        _write_snapshot(elements)
+        return
+
+    deltas = {}
+    persisted = {}
+    for key, entry in elements.items():
+        delta, persisted[key] = _element_delta(_persisted[key], entry)
+        if delta:
+            deltas[key] = delta
+    if not deltas:
+        return
+
+    if _log_appends + 1 >= snapshot_every or (compact_interval > 0 and time.time() - _snapshot_time >= compact_interval):
+        _write_snapshot(elements)
+        return
+
+    record = {"seq": _log_seq + 1, "updated_at": _utc_now_iso(), "elements": deltas}
+    with _LOG_FILE.open("a", encoding="utf-8") as log:
+        log.write(_canonical(record) + "\n")
+    _log_seq += 1
+    _log_appends += 1
+    _persisted = persisted
 
 
 def load() -> list[dict] | None:
@@ -4,15 +4,30 @@ Uses WebUntis JSON-RPC by default, with optional official REST API support.
 """
 
 import base64
+import hashlib
+import json
 import logging
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import date, timedelta
-from typing import Any
+from typing import Any, Callable, Iterable, Iterator, TypeVar
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
 
+import tokenstore
+from backoff import DEFAULT_POLICY
+from lesson import Lesson
 from config import (
     DAYS_AHEAD,
+    FETCH_WORKERS,
+    REST_PAGE_WORKERS,
+    REST_POOL_SIZE,
+    STREAM_TIMETABLE,
+    TOKEN_REFRESH_AHEAD,
     UNTIS_API_PASSWORD,
     UNTIS_CLIENT_ID,
     UNTIS_ELEMENT_ID,
@@ -35,16 +50,60 @@ _TYPE_SUBJECT = 3
 _TYPE_ROOM = 4
 # requests timeout: (connect_timeout_seconds, read_timeout_seconds)
 _REQUEST_TIMEOUT = (10, 30)
+# Transport failures retried by backoff.DEFAULT_POLICY
+_RETRYABLE_ERRORS = (requests.ConnectionError, requests.Timeout)
 _REST_TOKEN_URL = "https://api.webuntis.com/WebUntis/api/sso/v3/{tenant_id}/token?grant_type=client_credentials"
 _REST_TIMETABLE_URL = "https://api.webuntis.com/WebUntis/api/rest/extern/v3/timetable"
 _TOKEN_EXPIRY_SAFETY_SECONDS = 15
 _JSONRPC_PATH = "/WebUntis/jsonrpc.do"
 _CLIENT_IDENTITY = "untis-watcher"
+# Text chunk size used when streaming large getTimetable responses
+_STREAM_CHUNK_SIZE = 64 * 1024
+# JSON-RPC error code WebUntis returns once a JSESSIONID has expired
+_NOT_AUTHENTICATED_CODE = -8520
+
+_T = TypeVar("_T")
+
+# getTimetable *Fields option -> master-data lookup kind it names inline
+_FIELD_OPTION_KINDS = {
+    "klasseFields": "klassen",
+    "roomFields": "rooms",
+    "subjectFields": "subjects",
+    "teacherFields": "teachers",
+}
 
 _token_cache: dict[str, float | str | None] = {
     "access_token": None,
     "expires_at": 0.0,
 }
+_token_lock = threading.RLock()
+# None until the first token lookup decides whether tokenstore is usable
+_token_store_enabled: bool | None = None
+_token_refresher: threading.Thread | None = None
+_token_refresher_stop = threading.Event()
+# Never hit the SSO endpoint more often than this, even for very short-lived tokens
+_TOKEN_REFRESH_MIN_INTERVAL = 30
+
+
+# Shared keep-alive connection pool for all REST API calls, reused across cycles
+_rest_http: requests.Session | None = None
+# REST timetable page number -> last page entry (see _rest_page_entry), for 304 reuse
+_rest_page_cache: dict[int, dict[str, Any]] = {}
+# (lookups object, its digest) for the master data most recently used in a fetch
+_lookups_digest: tuple[Any, str] | None = None
+
+
+@dataclass
+class FetchResult:
+    """One element's fetch: the raw response digest, and lessons or None when it matched previous_digest."""
+    digest: str | None
+    lessons: list[dict] | None
+    # Master-data kinds that lacked an ID in this response and were re-requested inline
+    stale_lookups: list[str] = field(default_factory=list)
+
+
+class SessionExpiredError(ConnectionError):
+    """Raised when WebUntis rejects a call because the session is no longer authenticated."""
 
 
 def _rest_creds_status() -> tuple[bool, list[str]]:
@@ -61,6 +120,20 @@ def _rest_creds_status() -> tuple[bool, list[str]]:
     return all_set, missing
 
 
+def _rest_session() -> requests.Session:
+    """Return the pooled HTTP session used for every REST token and timetable request."""
+    global _rest_http
+    if _rest_http is None:
+        # Retries are handled by backoff.DEFAULT_POLICY so every call shares one policy.
+        adapter = HTTPAdapter(pool_maxsize=REST_POOL_SIZE)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        # gzip/deflate always; br too when the optional brotli package is installed.
+        session.headers["Accept-Encoding"] = make_headers(accept_encoding=True)["accept-encoding"]
+        _rest_http = session
+    return _rest_http
+
+
 def _school_cookie_value() -> str:
     """Return the WebUntis schoolname cookie value used by its web client."""
     encoded_school = base64.b64encode(UNTIS_SCHOOL.encode("utf-8")).decode("ascii")
@@ -71,27 +144,56 @@ def _jsonrpc_url() -> str:
     return f"https://{UNTIS_SERVER}{_JSONRPC_PATH}"
 
 
-def _jsonrpc_request(
+def _jsonrpc_body(method: str, params: dict[str, Any] | None, request_id: str | int | None) -> dict[str, Any]:
+    return {
+        "id": request_id or str(int(time.time() * 1000)),
+        "method": method,
+        "params": params or {},
+        "jsonrpc": "2.0",
+    }
+
+
+def _jsonrpc_post(
     session: requests.Session,
     method: str,
     params: dict[str, Any] | None = None,
     *,
     request_id: str | int | None = None,
-) -> Any:
-    """Call the WebUntis JSON-RPC endpoint and return the result payload."""
-    response = session.post(
+    stream: bool = False,
+) -> requests.Response:
+    response = DEFAULT_POLICY.call(
+        lambda: session.post(
+            session._untis_url,
+            params={"school": UNTIS_SCHOOL},
+            json=_jsonrpc_body(method, params, request_id),
+            timeout=_REQUEST_TIMEOUT,
+            stream=stream,
+        ),
         session._untis_url,
-        params={"school": UNTIS_SCHOOL},
-        json={
-            "id": request_id or str(int(time.time() * 1000)),
-            "method": method,
-            "params": params or {},
-            "jsonrpc": "2.0",
-        },
-        timeout=_REQUEST_TIMEOUT,
+        retry_on=_RETRYABLE_ERRORS,
     )
     response.raise_for_status()
+    return response
+
+
+def _raise_jsonrpc_error(method: str, error: Any) -> None:
+    if isinstance(error, dict) and error.get("code") == _NOT_AUTHENTICATED_CODE:
+        raise SessionExpiredError(f"WebUntis {method} failed: session is not authenticated.")
+    raise ConnectionError(f"WebUntis {method} failed: {error}")
+
+
+def _jsonrpc_request(
+    session: requests.Session,
+    method: str,
+    params: dict[str, Any] | None = None,
+    *,
+    request_id: str | int | None = None,
+) -> Any:
+    """Call the WebUntis JSON-RPC endpoint and return the result payload."""
+    return _jsonrpc_result(_jsonrpc_post(session, method, params, request_id=request_id), method)
+
 
+def _jsonrpc_result(response: requests.Response, method: str) -> Any:
     try:
         payload = response.json()
     except ValueError as exc:
@@ -100,12 +202,128 @@ def _jsonrpc_request(
     if not isinstance(payload, dict):
         raise ConnectionError(f"WebUntis {method} response had an unexpected shape.")
     if "error" in payload:
-        raise ConnectionError(f"WebUntis {method} failed: {payload['error']}")
+        _raise_jsonrpc_error(method, payload["error"])
     if "result" not in payload:
         raise ConnectionError(f"WebUntis {method} failed: missing result payload.")
     return payload["result"]
 
 
+class _NonArrayResult(Exception):
+    """Internal: a streamed JSON-RPC result turned out not to be an array."""
+
+    def __init__(self, value: Any) -> None:
+        super().__init__("JSON-RPC result is not an array")
+        self.value = value
+
+
+class _LookupMiss(Exception):
+    """Internal: a period uses an ID the cached master data for its kind does not know."""
+
+    def __init__(self, kind: str, entry_id: Any) -> None:
+        super().__init__(f"{kind} ID {entry_id} missing from the master-data cache")
+        self.kind = kind
+        self.entry_id = entry_id
+
+
+class _JsonStream:
+    """Incremental JSON reader over decoded text chunks, holding at most one value plus one chunk."""
+
+    _WHITESPACE = " \t\n\r"
+
+    def __init__(self, chunks: Iterator[str]) -> None:
+        self._chunks = chunks
+        self._buffer = ""
+        self._pos = 0
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        for chunk in self._chunks:
+            if chunk:
+                self._buffer = self._buffer[self._pos:] + chunk
+                self._pos = 0
+                return True
+        return False
+
+    def peek(self) -> str:
+        """Return the next non-whitespace character without consuming it."""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in self._WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                raise ValueError("unexpected end of JSON stream")
+
+    def take(self, expected: str | None = None) -> str:
+        """Consume the next non-whitespace character, optionally checking it."""
+        char = self.peek()
+        if expected is not None and char != expected:
+            raise ValueError(f"expected {expected!r} in JSON stream, got {char!r}")
+        self._pos += 1
+        return char
+
+    def value(self) -> Any:
+        """Decode the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number ending exactly at the buffer edge may continue in the next chunk.
+            if end == len(self._buffer) and not isinstance(value, (dict, list, str)) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+
+def _hashed_chunks(chunks: Iterator[str], hasher: Any) -> Iterator[str]:
+    for chunk in chunks:
+        hasher.update(chunk.encode("utf-8"))
+        yield chunk
+
+
+def _iter_jsonrpc_result(response: requests.Response, method: str, hasher: Any = None) -> Iterator[Any]:
+    """
+    Yield the items of a JSON-RPC "result" array one at a time while the body streams in.
+    Raises _NonArrayResult (before yielding anything) when the result is some other value.
+    hasher, if given, is updated with every chunk read.
+    """
+    response.encoding = response.encoding or "utf-8"
+    chunks = response.iter_content(chunk_size=_STREAM_CHUNK_SIZE, decode_unicode=True)
+    stream = _JsonStream(chunks if hasher is None else _hashed_chunks(chunks, hasher))
+    try:
+        stream.take("{")
+        if stream.peek() == "}":
+            raise ConnectionError(f"WebUntis {method} failed: missing result payload.")
+        while True:
+            key = stream.value()
+            stream.take(":")
+            if key == "result" and stream.peek() == "[":
+                stream.take("[")
+                if stream.peek() == "]":
+                    stream.take()
+                else:
+                    while True:
+                        yield stream.value()
+                        if stream.take() == "]":
+                            break
+                return
+            value = stream.value()
+            if key == "error":
+                _raise_jsonrpc_error(method, value)
+            if key == "result":
+                raise _NonArrayResult(value)
+            if stream.take() == "}":
+                raise ConnectionError(f"WebUntis {method} failed: missing result payload.")
+    except ValueError as exc:
+        raise ConnectionError(f"WebUntis {method} response was not valid JSON.") from exc
+    finally:
+        response.close()
+
+
 def _to_iso_minute(value: str | int | None) -> str:
     if value is None:
         return ""
@@ -141,7 +359,11 @@ def _from_date_and_time(raw_date: str | int | None, raw_time: str | int | None)
     return f"{date_text[:4]}-{date_text[4:6]}-{date_text[6:8]}T{time_text[:2]}:{time_text[2:4]}"
 
 
-def _extract_names(value: Any, lookup: dict[int, str] | None = None) -> list[str]:
+def _extract_names(value: Any, lookup: dict[int, str] | None = None, kind: str | None = None) -> list[str]:
+    """
+    Return the names of the subjects/teachers/rooms in a period field.
+    With a cached lookup for kind, an ID it does not know and the response does not name raises _LookupMiss.
+    """
     if value is None:
         return []
 
@@ -166,6 +388,9 @@ def _extract_names(value: Any, lookup: dict[int, str] | None = None) -> list[str
             if isinstance(candidate, str) and candidate:
                 names.append(candidate)
                 break
+        else:
+            if lookup and kind and entry_id is not None:
+                raise _LookupMiss(kind, entry_id)
 
     return names
 
@@ -201,7 +426,7 @@ def _normalise_period(
     subject_lookup: dict[int, str] | None = None,
     teacher_lookup: dict[int, str] | None = None,
     room_lookup: dict[int, str] | None = None,
-) -> dict[str, Any]:
+) -> Lesson:
     start_iso = _to_iso_minute(period.get("start") or period.get("startDateTime") or period.get("startTimeUtc"))
     end_iso = _to_iso_minute(period.get("end") or period.get("endDateTime") or period.get("endTimeUtc"))
 
@@ -210,9 +435,9 @@ def _normalise_period(
     if not end_iso:
         end_iso = _from_date_and_time(period.get("date") or period.get("endDate") or period.get("startDate"), period.get("endTime"))
 
-    period_subjects = _extract_names(period.get("subjects") or period.get("su"), subject_lookup)
-    period_teachers = _extract_names(period.get("teachers") or period.get("te"), teacher_lookup)
-    period_rooms = _extract_names(period.get("rooms") or period.get("ro"), room_lookup)
+    period_subjects = _extract_names(period.get("subjects") or period.get("su"), subject_lookup, "subjects")
+    period_teachers = _extract_names(period.get("teachers") or period.get("te"), teacher_lookup, "teachers")
+    period_rooms = _extract_names(period.get("rooms") or period.get("ro"), room_lookup, "rooms")
 
     code_val = period.get("code")
     cell_state = str(period.get("cellState", "")).upper()
@@ -225,28 +450,49 @@ def _normalise_period(
     else:
         code = None
 
-    return {
-        "id": period.get("id") or period.get("lessonId"),
-        "start": start_iso,
-        "end": end_iso,
-        "subjects": period_subjects,
-        "teachers": period_teachers,
-        "rooms": period_rooms,
-        "code": code,
-        "change_type": _resolve_change_type(code, period_subjects),
-    }
+    return Lesson(
+        id=period.get("id") or period.get("lessonId"),
+        start=start_iso,
+        end=end_iso,
+        subjects=period_subjects,
+        teachers=period_teachers,
+        rooms=period_rooms,
+        code=code,
+        change_type=_resolve_change_type(code, period_subjects),
+    )
+
+
+def _load_persisted_token() -> None:
+    """Seed the in-memory token cache from the encrypted token file once per process."""
+    global _token_store_enabled
+    if _token_store_enabled is not None:
+        return
+    _token_store_enabled = tokenstore.enabled()
+    if not _token_store_enabled:
+        return
+    stored = tokenstore.load()
+    if stored and stored[1] > float(_token_cache.get("expires_at") or 0):
+        _token_cache["access_token"], _token_cache["expires_at"] = stored
+        logger.info("[untis] Loaded REST bearer token from disk (expires in %.0fs).", stored[1] - time.time())
 
 
 def get_bearer_token() -> str:
     """Return a cached bearer token for WebUntis REST API or refresh when expired."""
+    with _token_lock:
+        _load_persisted_token()
+        now = time.time()
+        cached_token = _token_cache.get("access_token")
+        cached_expiry = float(_token_cache.get("expires_at") or 0)
+        if isinstance(cached_token, str) and cached_token and now < (cached_expiry - _TOKEN_EXPIRY_SAFETY_SECONDS):
+            logger.debug("[untis] Using cached REST bearer token (expires in %.0fs).",
+                         cached_expiry - now)
+            return cached_token
+        return _store_bearer_token(*_download_bearer_token())
+
+
+def _download_bearer_token() -> tuple[str, float]:
+    """Request a new bearer token from the SSO endpoint; returns (token, expires_at) without caching it."""
     now = time.time()
-    cached_token = _token_cache.get("access_token")
-    cached_expiry = float(_token_cache.get("expires_at") or 0)
-    if isinstance(cached_token, str) and cached_token and now < (cached_expiry - _TOKEN_EXPIRY_SAFETY_SECONDS):
-        logger.debug("[untis] Using cached REST bearer token (expires in %.0fs).",
-                     cached_expiry - now)
-        return cached_token
-
     if not (UNTIS_TENANT_ID and UNTIS_CLIENT_ID and UNTIS_API_PASSWORD):
         raise ConnectionError("REST token request requires UNTIS_TENANT_ID, UNTIS_CLIENT_ID, and UNTIS_API_PASSWORD.")
 
@@ -255,15 +501,19 @@ def get_bearer_token() -> str:
     url = _REST_TOKEN_URL.format(tenant_id=UNTIS_TENANT_ID)
 
     try:
-        response = requests.post(
+        response = DEFAULT_POLICY.call(
+            lambda: _rest_session().post(
+                url,
+                headers={
+                    "Authorization": f"Basic {basic}",
+                    "Content-Type": "application/x-www-form-urlencoded",
+                    "Accept": "application/json",
+                },
+                data="",
+                timeout=_REQUEST_TIMEOUT,
+            ),
             url,
-            headers={
-                "Authorization": f"Basic {basic}",
-                "Content-Type": "application/x-www-form-urlencoded",
-                "Accept": "application/json",
-            },
-            data="",
-            timeout=_REQUEST_TIMEOUT,
+            retry_on=_RETRYABLE_ERRORS,
         )
         response.raise_for_status()
         payload = response.json()
@@ -282,53 +532,107 @@ def get_bearer_token() -> str:
     except (TypeError, ValueError):
         expires_in_seconds = 0
 
-    _token_cache["access_token"] = token
-    _token_cache["expires_at"] = now + max(expires_in_seconds, 0)
     logger.info("[untis] REST bearer token obtained (expires in %ds).", expires_in_seconds)
+    return token, now + max(expires_in_seconds, 0)
+
+
+def _store_bearer_token(token: str, expires_at: float) -> str:
+    """Make token the cached (and, if enabled, persisted) bearer token. Caller holds _token_lock."""
+    _token_cache["access_token"] = token
+    _token_cache["expires_at"] = expires_at
+    if _token_store_enabled:
+        tokenstore.save(token, expires_at)
     return token
 
 
-def get_session() -> requests.Session | dict:
-    """Open a WebUntis session via REST credentials or JSON-RPC user/password login."""
+def _token_refresh_wait(now: float) -> float:
+    """Seconds until the cached token is due for background renewal (<= 0 means now)."""
+    expires_at = float(_token_cache.get("expires_at") or 0)
+    return expires_at - _TOKEN_EXPIRY_SAFETY_SECONDS - TOKEN_REFRESH_AHEAD - now
+
+
+def _refresh_token_until_stopped() -> None:
+    # Seed from token_cache.bin first so a still-valid token is not replaced at startup
+    with _token_lock:
+        _load_persisted_token()
+    last_refresh = 0.0
+    while not _token_refresher_stop.is_set():
+        now = time.time()
+        wait = max(_token_refresh_wait(now), last_refresh + _TOKEN_REFRESH_MIN_INTERVAL - now)
+        if wait > 0:
+            _token_refresher_stop.wait(wait)
+            continue
+
+        try:
+            # The SSO request runs without _token_lock, so fetches keep using the old,
+            # still valid token until the new one is swapped in.
+            token, expires_at = _download_bearer_token()
+            with _token_lock:
+                # Keep a newer token a fetch cycle may have obtained in the meantime
+                if expires_at > float(_token_cache.get("expires_at") or 0):
+                    _store_bearer_token(token, expires_at)
+        except Exception as exc:
+            logger.warning("[untis] Background REST token refresh failed: %s", exc)
+        last_refresh = time.time()
+
+
+def start_token_refresher() -> None:
+    """
+    Renew the REST bearer token in a background thread TOKEN_REFRESH_AHEAD seconds
+    before it would reach _TOKEN_EXPIRY_SAFETY_SECONDS, so fetch cycles never wait
+    on the SSO endpoint. Does nothing unless REST credentials are configured.
+    """
+    global _token_refresher
+    if not _rest_creds_status()[0] or (_token_refresher is not None and _token_refresher.is_alive()):
+        return
+    _token_refresher_stop.clear()
+    _token_refresher = threading.Thread(target=_refresh_token_until_stopped, name="token-refresher", daemon=True)
+    _token_refresher.start()
+    logger.info("[untis] Background REST token refresher started.")
+
+
+def stop_token_refresher() -> None:
+    """Stop the background token refresher, if running."""
+    _token_refresher_stop.set()
+
+
+def _use_rest_login() -> bool:
+    """Return whether to log in via REST credentials; raise if they are only partly configured."""
     use_rest, missing_rest = _rest_creds_status()
     if not use_rest and missing_rest and any([UNTIS_TENANT_ID, UNTIS_CLIENT_ID, UNTIS_API_PASSWORD]):
         raise ConnectionError(
             "Incomplete REST credentials. Set all of UNTIS_TENANT_ID, UNTIS_CLIENT_ID, UNTIS_API_PASSWORD. "
             f"Missing: {', '.join(missing_rest)}"
         )
-
     if use_rest:
         logger.info("[untis] Authenticating via REST API (tenant: %s).", UNTIS_TENANT_ID)
-        return {
-            "mode": "rest",
-            "token": get_bearer_token(),
-        }
+    else:
+        logger.info("[untis] Authenticating via JSON-RPC as user '%s' on %s (school: %s).",
+                    UNTIS_USER, UNTIS_SERVER, UNTIS_SCHOOL)
+    return use_rest
+
+
+# Headers the WebUntis web client sends; some servers reject JSON-RPC calls without them
+_JSONRPC_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                  "(KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36",
+    "Accept": "application/json",
+    "Cache-Control": "no-cache",
+    "Pragma": "no-cache",
+    "X-Requested-With": "XMLHttpRequest",
+}
 
-    logger.info("[untis] Authenticating via JSON-RPC as user '%s' on %s (school: %s).",
-                UNTIS_USER, UNTIS_SERVER, UNTIS_SCHOOL)
 
-    session = requests.Session()
-    session._untis_url = _jsonrpc_url()
-    session.headers.update({
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-                      "(KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36",
-        "Accept": "application/json",
-        "Cache-Control": "no-cache",
-        "Pragma": "no-cache",
-        "X-Requested-With": "XMLHttpRequest",
-    })
-
-    result = _jsonrpc_request(
-        session,
-        "authenticate",
-        {
-            "user": UNTIS_USER,
-            "password": UNTIS_PASSWORD,
-            "client": _CLIENT_IDENTITY,
-        },
-        request_id="login",
-    )
+def _authenticate_params() -> dict[str, str]:
+    return {
+        "user": UNTIS_USER,
+        "password": UNTIS_PASSWORD,
+        "client": _CLIENT_IDENTITY,
+    }
+
 
+def _open_jsonrpc_session(session: Any, result: Any) -> None:
+    """Check an authenticate result and attach the session ID, person and cookies to session."""
     if not isinstance(result, dict):
         raise ConnectionError("WebUntis login failed: unexpected authentication response shape.")
 
@@ -346,6 +650,22 @@ def get_session() -> requests.Session | dict:
 
     logger.info("[untis] JSON-RPC session opened (personId=%s, personType=%s).",
                 session._person_id, session._person_type)
+
+
+def get_session() -> requests.Session | dict:
+    """Open a WebUntis session via REST credentials or JSON-RPC user/password login."""
+    if _use_rest_login():
+        return {
+            "mode": "rest",
+            "token": get_bearer_token(),
+        }
+
+    session = requests.Session()
+    session._untis_url = _jsonrpc_url()
+    session.headers.update(_JSONRPC_HEADERS)
+
+    result = _jsonrpc_request(session, "authenticate", _authenticate_params(), request_id="login")
+    _open_jsonrpc_session(session, result)
     return session
 
 
@@ -360,6 +680,15 @@ def validate_session(session: requests.Session | dict) -> bool:
         return False
 
 
+def get_latest_import_time(session: requests.Session | dict) -> int | None:
+    """Return the school's last timetable import time (epoch ms), or None for REST sessions."""
+    if isinstance(session, dict) and session.get("mode") == "rest":
+        return None
+
+    result = _jsonrpc_request(session, "getLatestImportTime", request_id="importtime")
+    return result if isinstance(result, int) else None
+
+
 def logout(session: requests.Session | dict) -> None:
     """Log out of WebUntis."""
     if isinstance(session, dict) and session.get("mode") == "rest":
@@ -372,133 +701,487 @@ def logout(session: requests.Session | dict) -> None:
         pass  # best-effort logout
 
 
-def fetch_rest(token: str) -> list[dict]:
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Accept": "application/json",
+def _rest_conditional_headers(headers: dict[str, str], page: int) -> dict[str, str]:
+    """Add If-None-Match / If-Modified-Since for a page fetched before."""
+    cached = _rest_page_cache.get(page)
+    if not cached:
+        return headers
+    conditional = dict(headers)
+    if cached.get("etag"):
+        conditional["If-None-Match"] = cached["etag"]
+    if cached.get("last_modified"):
+        conditional["If-Modified-Since"] = cached["last_modified"]
+    return conditional
+
+
+def _rest_page_entry(page: int, body: bytes, response_headers: Any) -> dict[str, Any]:
+    """
+    Normalise a REST timetable page and remember it for conditional requests.
+    Entries hold the page's normalised lessons, pagination, validators and body
+    digest; a body identical to the cached one is not parsed again.
+    """
+    digest = _digest(body)
+    cached = _rest_page_cache.get(page)
+    if cached and cached["digest"] == digest:
+        logger.debug("[untis] REST page %d: body unchanged.", page)
+        return cached
+
+    payload = json.loads(body)
+    page_items, pagination = _rest_page_items(payload)
+    links = payload.get("links") if isinstance(payload, dict) else None
+    entry = {
+        "lessons": [_normalise_period(period) for period in page_items if isinstance(period, dict)],
+        "pagination": pagination,
+        "links_next": isinstance(links, dict) and bool(links.get("next")),
+        "etag": response_headers.get("ETag"),
+        "last_modified": response_headers.get("Last-Modified"),
+        "digest": digest,
     }
+    _rest_page_cache[page] = entry
+    logger.debug("[untis] REST page %d: received %d period(s).", page, len(page_items))
+    return entry
 
-    raw_periods = []
-    page = 1
-    while True:
-        try:
-            response = requests.get(
+
+def _fetch_rest_page(headers: dict[str, str], page: int) -> dict[str, Any]:
+    """Fetch one page of the REST timetable; a 304 reuses the cached page entry."""
+    try:
+        response = DEFAULT_POLICY.call(
+            lambda: _rest_session().get(
                 _REST_TIMETABLE_URL,
-                headers=headers,
+                headers=_rest_conditional_headers(headers, page),
                 params={"page": page},
                 timeout=_REQUEST_TIMEOUT,
-            )
-            response.raise_for_status()
-            payload = response.json()
-        except requests.RequestException as exc:
-            raise ConnectionError(f"Failed to fetch timetable from WebUntis REST API: {exc}") from exc
-        except ValueError as exc:
-            raise ConnectionError("Failed to parse WebUntis REST timetable response as JSON.") from exc
-
-        if isinstance(payload, list):
-            page_items = payload
-            pagination = {}
-        else:
-            page_items = payload.get("data") or payload.get("result") or payload.get("items") or payload.get("timetable") or []
-            pagination = payload.get("pagination") or payload.get("page") or {}
+            ),
+            _REST_TIMETABLE_URL,
+            retry_on=_RETRYABLE_ERRORS,
+        )
+        if response.status_code == 401:
+            _token_cache["access_token"] = None
+            raise SessionExpiredError("WebUntis REST API rejected the bearer token.")
+        if response.status_code == 304 and page in _rest_page_cache:
+            logger.debug("[untis] REST page %d: not modified.", page)
+            return _rest_page_cache[page]
+        response.raise_for_status()
+        return _rest_page_entry(page, response.content, response.headers)
+    except requests.RequestException as exc:
+        raise ConnectionError(f"Failed to fetch timetable from WebUntis REST API: {exc}") from exc
+    except ValueError as exc:
+        raise ConnectionError("Failed to parse WebUntis REST timetable response as JSON.") from exc
 
-        if not isinstance(page_items, list):
-            raise ConnectionError("WebUntis REST timetable response did not contain a list of periods.")
 
-        raw_periods.extend(page_items)
-        logger.debug("[untis] REST page %d: received %d period(s).", page, len(page_items))
+def _rest_page_items(payload: Any) -> tuple[list, dict]:
+    """Split a REST timetable page into its period list and pagination block."""
+    if isinstance(payload, list):
+        page_items = payload
+        pagination = {}
+    else:
+        page_items = payload.get("data") or payload.get("result") or payload.get("items") or payload.get("timetable") or []
+        pagination = payload.get("pagination") or payload.get("page") or {}
 
-        has_next = False
-        if isinstance(pagination, dict):
-            if isinstance(pagination.get("hasNext"), bool):
-                has_next = pagination["hasNext"]
-            elif isinstance(pagination.get("nextPage"), int):
-                has_next = pagination["nextPage"] > page
-            elif isinstance(pagination.get("totalPages"), int):
-                has_next = page < pagination["totalPages"]
+    if not isinstance(page_items, list):
+        raise ConnectionError("WebUntis REST timetable response did not contain a list of periods.")
+    return page_items, pagination if isinstance(pagination, dict) else {}
 
-        if not has_next:
-            links = payload.get("links") if isinstance(payload, dict) else None
-            if isinstance(links, dict) and links.get("next"):
-                has_next = True
 
-        if not has_next:
-            break
+def _rest_has_next(entry: dict[str, Any], page: int) -> bool:
+    pagination = entry["pagination"]
+    if isinstance(pagination.get("hasNext"), bool):
+        return pagination["hasNext"]
+    if isinstance(pagination.get("nextPage"), int):
+        return pagination["nextPage"] > page
+    if isinstance(pagination.get("totalPages"), int):
+        return page < pagination["totalPages"]
+    return entry["links_next"]
 
-        page += 1
 
-    lessons = [_normalise_period(period) for period in raw_periods if isinstance(period, dict)]
+def _merge_rest_pages(entries: list[dict[str, Any]]) -> list[dict]:
+    lessons = [lesson for entry in entries for lesson in entry["lessons"]]
     lessons.sort(key=lambda lesson: (lesson["start"], str(lesson["id"]) if lesson["id"] is not None else ""))
     return lessons
 
 
-def fetch(session: requests.Session | dict) -> list[dict]:
-    if isinstance(session, dict) and session.get("mode") == "rest":
-        token = session.get("token")
-        if not isinstance(token, str) or not token:
-            raise ConnectionError("REST session missing bearer token.")
-        return fetch_rest(token)
+def fetch_rest(token: str) -> list[dict]:
+    return _merge_rest_pages(_fetch_rest_entries(token))
 
-    if not validate_session(session):
-        raise ConnectionError("WebUntis session is no longer valid.")
 
-    today = date.today()
-    week_start = today - timedelta(days=today.weekday())
-    range_end = week_start + timedelta(days=DAYS_AHEAD)
-
-    logger.info("[untis] Fetching timetable for element %s (type %s), %s to %s (%d days ahead).",
-                session._person_id, session._person_type,
-                week_start.isoformat(), range_end.isoformat(), DAYS_AHEAD)
-
-    result = _jsonrpc_request(
-        session,
-        "getTimetable",
-        {
-            "options": {
-                "id": int(time.time() * 1000),
-                "element": {
-                    "id": session._person_id,
-                    "type": session._person_type,
-                },
-                "startDate": week_start.strftime("%Y%m%d"),
-                "endDate": range_end.strftime("%Y%m%d"),
-                "showInfo": True,
-                "showSubstText": True,
-                "showLsText": True,
-                "showLsNumber": True,
-                "showStudentgroup": True,
-                "showBooking": True,
-                "klasseFields": ["id", "name", "longname", "externalkey"],
-                "roomFields": ["id", "name", "longname", "externalkey"],
-                "subjectFields": ["id", "name", "longname", "externalkey"],
-                "teacherFields": ["id", "name", "longname", "externalkey"],
-            }
-        },
-        request_id="timetable",
-    )
+def _fetch_rest_entries(token: str) -> list[dict[str, Any]]:
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Accept": "application/json",
+    }
 
+    entries = [_fetch_rest_page(headers, 1)]
+
+    total_pages = entries[0]["pagination"].get("totalPages")
+    if isinstance(total_pages, int) and total_pages > 1:
+        # Page count is known up front: fetch the rest concurrently, merge in page order.
+        remaining = range(2, total_pages + 1)
+        workers = max(1, min(REST_PAGE_WORKERS, len(remaining)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            entries.extend(pool.map(lambda page: _fetch_rest_page(headers, page), remaining))
+    else:
+        page = 1
+        while _rest_has_next(entries[-1], page):
+            page += 1
+            entries.append(_fetch_rest_page(headers, page))
+
+    # Pages beyond the current end must not be reused if the timetable grows again.
+    for stale_page in [page for page in _rest_page_cache if page > len(entries)]:
+        del _rest_page_cache[stale_page]
+
+    return entries
+
+
+def _lessons_from_timetable_result(
+    result: Any,
+    lookups: dict[str, dict[int, str] | None] | None = None,
+) -> list[dict]:
+    """
+    Normalise a getTimetable result payload into sorted lesson dicts.
+    lookups are cached master-data names used for IDs the response does not name inline.
+    """
+    lookups = lookups or {}
     if isinstance(result, list):
         periods = result
-        subjects = {}
-        teachers = {}
-        rooms = {}
+        subjects = lookups.get("subjects") or {}
+        teachers = lookups.get("teachers") or {}
+        rooms = lookups.get("rooms") or {}
     elif isinstance(result, dict):
         periods = result.get("result") or result.get("data") or result.get("timetable") or []
-        subjects = _lookup_by_id(result.get("subjects"))
-        teachers = _lookup_by_id(result.get("teachers"))
-        rooms = _lookup_by_id(result.get("rooms"))
+        subjects = _lookup_by_id(result.get("subjects")) or lookups.get("subjects") or {}
+        teachers = _lookup_by_id(result.get("teachers")) or lookups.get("teachers") or {}
+        rooms = _lookup_by_id(result.get("rooms")) or lookups.get("rooms") or {}
     else:
         raise ConnectionError("WebUntis timetable response had an unexpected shape.")
 
     if not isinstance(periods, list):
         raise ConnectionError("WebUntis timetable response did not contain a list of periods.")
 
-    lessons = [
-        _normalise_period(period, subject_lookup=subjects, teacher_lookup=teachers, room_lookup=rooms)
-        for period in periods
-        if isinstance(period, dict)
-    ]
+    lessons = list(_iter_normalised_periods(periods, subjects, teachers, rooms))
     lessons.sort(key=lambda lesson: (lesson["start"], str(lesson["id"]) if lesson["id"] is not None else ""))
     logger.info("[untis] Timetable fetched: %d raw period(s) normalised to %d lesson(s).",
                 len(periods), len(lessons))
     return lessons
+
+
+def _iter_normalised_periods(
+    periods: Iterable[Any],
+    subjects: dict[int, str],
+    teachers: dict[int, str],
+    rooms: dict[int, str],
+) -> Iterator[dict]:
+    for period in periods:
+        if isinstance(period, dict):
+            yield _normalise_period(period, subject_lookup=subjects, teacher_lookup=teachers, room_lookup=rooms)
+
+
+def _stream_timetable(
+    session: requests.Session,
+    params: dict[str, Any],
+    request_id: str,
+    lookups: dict[str, dict[int, str] | None] | None,
+    context: bytes,
+    previous_digest: str | None,
+) -> FetchResult:
+    """
+    Call getTimetable and normalise periods as they stream in, so only one raw
+    period is held in memory at a time instead of the whole decoded response.
+    The digest is only known once the body has been read, so a match here
+    saves the sort and everything downstream but not the parse.
+    """
+    response = _jsonrpc_post(session, "getTimetable", params, request_id=request_id, stream=True)
+    lookups = lookups or {}
+    hasher = hashlib.blake2b(context, digest_size=16)
+    try:
+        lessons = list(_iter_normalised_periods(
+            _iter_jsonrpc_result(response, "getTimetable", hasher),
+            lookups.get("subjects") or {},
+            lookups.get("teachers") or {},
+            lookups.get("rooms") or {},
+        ))
+    except _NonArrayResult as result:
+        return FetchResult(None, _lessons_from_timetable_result(result.value, lookups))
+
+    digest = hasher.hexdigest()
+    if digest == previous_digest:
+        logger.info("[untis] Timetable streamed: response unchanged since last fetch.")
+        return FetchResult(digest, None)
+    lessons.sort(key=lambda lesson: (lesson["start"], str(lesson["id"]) if lesson["id"] is not None else ""))
+    logger.info("[untis] Timetable streamed: %d lesson(s) normalised.", len(lessons))
+    return FetchResult(digest, lessons)
+
+
+def _digest(*parts: bytes) -> str:
+    hasher = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        hasher.update(part)
+    return hasher.hexdigest()
+
+
+def _lookups_fingerprint(lookups: dict[str, dict[int, str] | None] | None) -> str:
+    """Digest of the master data used to name IDs; memoised while masterdata hands out the same dict."""
+    global _lookups_digest
+    if not lookups:
+        return ""
+    if _lookups_digest is None or _lookups_digest[0] is not lookups:
+        _lookups_digest = (lookups, _digest(json.dumps(lookups, sort_keys=True, ensure_ascii=False).encode("utf-8")))
+    return _lookups_digest[1]
+
+
+def _digest_context(first_day: date, last_day: date, lookups: dict[str, dict[int, str] | None] | None) -> bytes:
+    """
+    Everything besides the response body that shapes the normalised lessons.
+    The same body for another window, or resolved with other master data, must not match.
+    """
+    return f"{first_day.isoformat()}:{last_day.isoformat()}:{_lookups_fingerprint(lookups)}\n".encode("ascii")
+
+
+def fetch_window() -> tuple[date, date]:
+    """Return the (start, end) dates fetch() requests: this week's Monday plus DAYS_AHEAD."""
+    today = date.today()
+    week_start = today - timedelta(days=today.weekday())
+    return week_start, week_start + timedelta(days=DAYS_AHEAD)
+
+
+# Days from today (inclusive) covered by each partial tier of a tiered fetch
+_TIER_DAYS = {"near": 2, "week": 7}
+
+
+def tier_window(tier: str) -> tuple[date, date]:
+    """
+    Return the (start, end) dates requested for a tiered fetch: "near" is today
+    and tomorrow, "week" the next seven days, "full" the whole fetch_window().
+    """
+    window_start, window_end = fetch_window()
+    if tier == "full":
+        return window_start, window_end
+    today = date.today()
+    return today, min(window_end, today + timedelta(days=_TIER_DAYS[tier] - 1))
+
+
+def _timetable_field_options(lookups: dict[str, dict[int, str] | None] | None) -> dict[str, list[str]]:
+    """Ask getTimetable to name inline only the kinds the master-data cache cannot resolve."""
+    lookups = lookups or {}
+    return {
+        option: ["id", "name", "longname", "externalkey"]
+        for option, kind in _FIELD_OPTION_KINDS.items()
+        if lookups.get(kind) is None
+    }
+
+
+def fetch(
+    session: requests.Session | dict,
+    element: dict | None = None,
+    *,
+    lookups: dict[str, dict[int, str] | None] | None = None,
+    window: tuple[date, date] | None = None,
+) -> list[dict]:
+    """
+    Fetch and normalise the timetable for one element.
+    element is a {"type": ..., "id": ...} dict; None means the logged-in user's own timetable.
+    lookups come from masterdata.get_lookups(); kinds it covers are requested as IDs only.
+    window overrides fetch_window() with an inclusive (start, end) date range.
+    """
+    return fetch_result(session, element, lookups=lookups, window=window).lessons
+
+
+def fetch_result(
+    session: requests.Session | dict,
+    element: dict | None = None,
+    *,
+    lookups: dict[str, dict[int, str] | None] | None = None,
+    window: tuple[date, date] | None = None,
+    previous_digest: str | None = None,
+) -> FetchResult:
+    """
+    Like fetch(), but also return a digest of the raw response.  When it equals
+    previous_digest the response is not parsed or normalised and lessons is None.
+    """
+    if isinstance(session, dict) and session.get("mode") == "rest":
+        return _fetch_rest_result(session, element, window, previous_digest)
+
+    stale_lookups = []
+    while True:
+        params, request_id, context = _timetable_request(session, element, lookups, window)
+        try:
+            if STREAM_TIMETABLE:
+                result = _stream_timetable(session, params, request_id, lookups, context, previous_digest)
+            else:
+                response = _jsonrpc_post(session, "getTimetable", params, request_id=request_id)
+                result = _timetable_response_result(response, context, lookups, previous_digest)
+        except _LookupMiss as miss:
+            lookups = _without_lookup(lookups, miss, stale_lookups)
+            continue
+        result.stale_lookups = stale_lookups
+        return result
+
+
+def _without_lookup(
+    lookups: dict[str, dict[int, str] | None],
+    miss: _LookupMiss,
+    stale_lookups: list[str],
+) -> dict[str, dict[int, str] | None]:
+    """
+    Return lookups with the missed kind dropped, so the retried getTimetable names it inline,
+    and note the kind in stale_lookups. Each kind can miss only once, which bounds the retries.
+    """
+    logger.info("[untis] %s; requesting %s names inline.", miss, miss.kind)
+    stale_lookups.append(miss.kind)
+    return {**lookups, miss.kind: None}
+
+
+def _fetch_rest_result(
+    session: dict,
+    element: dict | None,
+    window: tuple[date, date] | None,
+    previous_digest: str | None,
+) -> FetchResult:
+    if element is not None:
+        raise ConnectionError("The REST API only serves the authenticated user's timetable; "
+                              "watching other elements requires JSON-RPC login.")
+    token = session.get("token")
+    if not isinstance(token, str) or not token:
+        raise ConnectionError("REST session missing bearer token.")
+    week_start, range_end = window or fetch_window()
+    entries = _fetch_rest_entries(token)
+    digest = _digest(_digest_context(week_start, range_end, None), *(entry["digest"].encode("ascii") for entry in entries))
+    if digest == previous_digest:
+        logger.info("[untis] REST timetable unchanged since last fetch.")
+        return FetchResult(digest, None)
+    lessons = _merge_rest_pages(entries)
+    if window is None:
+        return FetchResult(digest, lessons)
+    # The REST endpoint has no date range; trim so callers get only the window they asked for.
+    first_day, last_day = window[0].isoformat(), window[1].isoformat()
+    return FetchResult(digest, [lesson for lesson in lessons if first_day <= str(lesson["start"])[:10] <= last_day])
+
+
+def _timetable_request(
+    session: Any,
+    element: dict | None,
+    lookups: dict[str, dict[int, str] | None] | None,
+    window: tuple[date, date] | None,
+) -> tuple[dict[str, Any], str, bytes]:
+    """Build the getTimetable params for one element; returns (params, request ID, digest context)."""
+    week_start, range_end = window or fetch_window()
+    element_id = element["id"] if element else session._person_id
+    element_type = element["type"] if element else session._person_type
+
+    logger.info("[untis] Fetching timetable for element %s (type %s), %s to %s.",
+                element_id, element_type, week_start.isoformat(), range_end.isoformat())
+
+    params = {
+        "options": {
+            "id": int(time.time() * 1000),
+            "element": {
+                "id": element_id,
+                "type": element_type,
+            },
+            "startDate": week_start.strftime("%Y%m%d"),
+            "endDate": range_end.strftime("%Y%m%d"),
+            "showInfo": True,
+            "showSubstText": True,
+            "showLsText": True,
+            "showLsNumber": True,
+            "showStudentgroup": True,
+            "showBooking": True,
+            **_timetable_field_options(lookups),
+        }
+    }
+    return params, f"timetable-{element_type}-{element_id}", _digest_context(week_start, range_end, lookups)
+
+
+def _timetable_response_result(
+    response: Any,
+    context: bytes,
+    lookups: dict[str, dict[int, str] | None] | None,
+    previous_digest: str | None,
+) -> FetchResult:
+    """Digest a buffered getTimetable response and normalise it unless it matches previous_digest."""
+    digest = _digest(context, response.content)
+    if digest == previous_digest:
+        logger.info("[untis] getTimetable response unchanged since last fetch; skipping parse.")
+        return FetchResult(digest, None)
+    result = _jsonrpc_result(response, "getTimetable")
+    return FetchResult(digest, _lessons_from_timetable_result(result, lookups))
+
+
+def fetch_many(
+    session: requests.Session | dict,
+    elements: list[dict | None],
+    *,
+    lookups: dict[str, dict[int, str] | None] | None = None,
+    window: tuple[date, date] | None = None,
+    max_workers: int = FETCH_WORKERS,
+) -> list[list[dict]]:
+    """
+    Fetch several elements concurrently over one authenticated session.
+    Results are returned in the order of elements; the first failure is raised.
+    """
+    results = fetch_many_results(session, elements, lookups=lookups, window=window, max_workers=max_workers)
+    return [result.lessons for result in results]
+
+
+def fetch_many_results(
+    session: requests.Session | dict,
+    elements: list[dict | None],
+    *,
+    lookups: dict[str, dict[int, str] | None] | None = None,
+    window: tuple[date, date] | None = None,
+    previous_digests: list[str | None] | None = None,
+    max_workers: int = FETCH_WORKERS,
+) -> list[FetchResult]:
+    """fetch_many() returning a FetchResult per element; previous_digests lines up with elements."""
+    digests = previous_digests or [None] * len(elements)
+
+    def fetch_one(element: dict | None, previous_digest: str | None) -> FetchResult:
+        return fetch_result(session, element, lookups=lookups, window=window, previous_digest=previous_digest)
+
+    if len(elements) <= 1:
+        return [fetch_one(element, digest) for element, digest in zip(elements, digests)]
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(elements)))) as pool:
+        return list(pool.map(fetch_one, elements, digests))
+
+
+class SessionManager:
+    """
+    Keep one WebUntis session open across poll cycles.
+
+    The session is opened lazily on first use, reused until a call fails with
+    SessionExpiredError, then re-authenticated once and the call retried.
+    close() logs out and should only be called on shutdown.
+    """
+
+    def __init__(self, login: Callable[[], requests.Session | dict] = get_session) -> None:
+        self._login = login
+        self._session: requests.Session | dict | None = None
+
+    def get(self) -> requests.Session | dict:
+        """Return the open session, logging in first if there is none."""
+        if self._session is None:
+            self._session = self._login()
+        elif isinstance(self._session, dict) and self._session.get("mode") == "rest":
+            # Served from the in-memory cache until it is close to expiry.
+            self._session["token"] = get_bearer_token()
+        return self._session
+
+    def call(self, fn: Callable[..., _T], *args: Any, **kwargs: Any) -> _T:
+        """Run fn(session, *args, **kwargs), re-authenticating once if the session expired."""
+        session = self.get()
+        try:
+            return fn(session, *args, **kwargs)
+        except SessionExpiredError:
+            logger.info("[untis] Session expired; re-authenticating.")
+            self.invalidate()
+            return fn(self.get(), *args, **kwargs)
+
+    def invalidate(self) -> None:
+        """Forget the current session without logging out (it is already dead server-side)."""
+        self._session = None
+
+    def close(self) -> None:
+        """Log out of the current session, if any."""
+        if self._session is not None:
+            logout(self._session)
+            self._session = None
@@ -0,0 +1,235 @@
+"""
+timetable_async.py – asyncio-native WebUntis client.
+
+Mirrors the surface of timetable.py (get_session / fetch / fetch_result /
+fetch_many / fetch_rest / logout) so many fetches can run concurrently on one
+event loop next to Telegram sends and AI calls.
+
+JSON-RPC calls go out on an httpx.AsyncClient owned by the session, so a
+session lives and dies with the event loop that opened it. Request building,
+response parsing, normalisation and digests are shared with timetable.py.
+REST calls run the sync client in worker threads: they already share its
+pooled connections, page cache and token lock, and the REST API only ever
+serves a single timetable.
+
+run_fetch_many_results() is the blocking entry point main.py uses with
+ASYNC_FETCH=true, on top of the login held by timetable.SessionManager.
+"""
+
+import asyncio
+import logging
+from datetime import date
+from typing import Any
+
+import httpx
+
+import timetable
+from backoff import DEFAULT_POLICY
+from config import FETCH_WORKERS, UNTIS_SCHOOL
+from timetable import FetchResult
+
+logger = logging.getLogger("untis-watcher")
+
+_REQUEST_TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+
+
+def _new_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=_REQUEST_TIMEOUT,
+        limits=httpx.Limits(max_connections=FETCH_WORKERS, max_keepalive_connections=FETCH_WORKERS),
+        headers=timetable._JSONRPC_HEADERS,
+    )
+
+
+async def _jsonrpc_request(
+    client: httpx.AsyncClient,
+    method: str,
+    params: dict[str, Any] | None = None,
+    *,
+    request_id: str | int | None = None,
+    raw: bool = False,
+) -> Any:
+    """Call the WebUntis JSON-RPC endpoint and return the result payload (or the response when raw)."""
+    try:
+        response = await DEFAULT_POLICY.acall(
+            lambda: client.post(
+                client._untis_url,
+                params={"school": UNTIS_SCHOOL},
+                json=timetable._jsonrpc_body(method, params, request_id),
+            ),
+            client._untis_url,
+            retry_on=(httpx.TransportError,),
+        )
+        response.raise_for_status()
+    except httpx.HTTPError as exc:
+        raise ConnectionError(f"WebUntis {method} request failed: {exc}") from exc
+    return response if raw else timetable._jsonrpc_result(response, method)
+
+
+async def get_bearer_token() -> str:
+    """
+    Return a cached bearer token for WebUntis REST API or refresh when expired.
+    Runs the sync client's get_bearer_token in a worker thread, so both clients and the
+    background refresher share _token_lock and the persisted token_cache.bin.
+    """
+    return await asyncio.to_thread(timetable.get_bearer_token)
+
+
+async def get_session() -> httpx.AsyncClient | dict:
+    """Open a WebUntis session via REST credentials or JSON-RPC user/password login."""
+    if timetable._use_rest_login():
+        return {
+            "mode": "rest",
+            "token": await get_bearer_token(),
+        }
+
+    client = _new_client()
+    client._untis_url = timetable._jsonrpc_url()
+
+    try:
+        result = await _jsonrpc_request(client, "authenticate", timetable._authenticate_params(), request_id="login")
+        timetable._open_jsonrpc_session(client, result)
+    except Exception:
+        await client.aclose()
+        raise
+    return client
+
+
+async def get_latest_import_time(session: httpx.AsyncClient | dict) -> int | None:
+    """Return the school's last timetable import time (epoch ms), or None for REST sessions."""
+    if isinstance(session, dict) and session.get("mode") == "rest":
+        return None
+
+    result = await _jsonrpc_request(session, "getLatestImportTime", request_id="importtime")
+    return result if isinstance(result, int) else None
+
+
+async def logout(session: httpx.AsyncClient | dict) -> None:
+    """Log out of WebUntis and close the session's connections."""
+    if isinstance(session, dict) and session.get("mode") == "rest":
+        return
+
+    try:
+        await _jsonrpc_request(session, "logout", request_id="logout")
+        logger.debug("[untis] JSON-RPC session logged out.")
+    except Exception:
+        pass  # best-effort logout
+    finally:
+        await session.aclose()
+
+
+async def fetch_rest(token: str) -> list[dict]:
+    return await asyncio.to_thread(timetable.fetch_rest, token)
+
+
+async def fetch(
+    session: httpx.AsyncClient | dict,
+    element: dict | None = None,
+    *,
+    lookups: dict[str, dict[int, str] | None] | None = None,
+    window: tuple[date, date] | None = None,
+) -> list[dict]:
+    """
+    Fetch and normalise the timetable for one element.
+    element is a {"type": ..., "id": ...} dict; None means the logged-in user's own timetable.
+    lookups come from masterdata.get_lookups(); kinds it covers are requested as IDs only.
+    window overrides fetch_window() with an inclusive (start, end) date range.
+    """
+    return (await fetch_result(session, element, lookups=lookups, window=window)).lessons
+
+
+async def fetch_result(
+    session: httpx.AsyncClient | dict,
+    element: dict | None = None,
+    *,
+    lookups: dict[str, dict[int, str] | None] | None = None,
+    window: tuple[date, date] | None = None,
+    previous_digest: str | None = None,
+) -> FetchResult:
+    """
+    Like fetch(), but also return a digest of the raw response.  When it equals
+    previous_digest the response is not parsed or normalised and lessons is None.
+    """
+    if isinstance(session, dict) and session.get("mode") == "rest":
+        return await asyncio.to_thread(
+            timetable.fetch_result, session, element, window=window, previous_digest=previous_digest,
+        )
+
+    stale_lookups = []
+    while True:
+        params, request_id, context = timetable._timetable_request(session, element, lookups, window)
+        response = await _jsonrpc_request(session, "getTimetable", params, request_id=request_id, raw=True)
+        try:
+            result = timetable._timetable_response_result(response, context, lookups, previous_digest)
+        except timetable._LookupMiss as miss:
+            lookups = timetable._without_lookup(lookups, miss, stale_lookups)
+            continue
+        result.stale_lookups = stale_lookups
+        return result
+
+
+async def fetch_many(
+    session: httpx.AsyncClient | dict,
+    elements: list[dict | None],
+    *,
+    lookups: dict[str, dict[int, str] | None] | None = None,
+    window: tuple[date, date] | None = None,
+    max_concurrency: int = FETCH_WORKERS,
+) -> list[list[dict]]:
+    """
+    Fetch several elements concurrently over one authenticated session.
+    Results are returned in the order of elements; the first failure is raised.
+    """
+    results = await fetch_many_results(session, elements, lookups=lookups, window=window,
+                                       max_concurrency=max_concurrency)
+    return [result.lessons for result in results]
+
+
+async def fetch_many_results(
+    session: httpx.AsyncClient | dict,
+    elements: list[dict | None],
+    *,
+    lookups: dict[str, dict[int, str] | None] | None = None,
+    window: tuple[date, date] | None = None,
+    previous_digests: list[str | None] | None = None,
+    max_concurrency: int = FETCH_WORKERS,
+) -> list[FetchResult]:
+    """fetch_many() returning a FetchResult per element; previous_digests lines up with elements."""
+    digests = previous_digests or [None] * len(elements)
+    limit = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def fetch_one(element: dict | None, previous_digest: str | None) -> FetchResult:
+        async with limit:
+            return await fetch_result(session, element, lookups=lookups, window=window,
+                                      previous_digest=previous_digest)
+
+    # gather() keeps element order regardless of completion order
+    return list(await asyncio.gather(*(fetch_one(element, digest) for element, digest in zip(elements, digests))))
+
+
+def _client_for(session: Any) -> httpx.AsyncClient:
+    """Open an AsyncClient that continues an existing sync JSON-RPC login (same cookies and person)."""
+    client = _new_client()
+    client._untis_url = session._untis_url
+    client._person_id = session._person_id
+    client._person_type = session._person_type
+    for cookie in session.cookies:
+        client.cookies.set(cookie.name, cookie.value)
+    return client
+
+
+def run_fetch_many_results(session: Any, elements: list[dict | None], **options: Any) -> list[FetchResult]:
+    """
+    Blocking fetch_many_results() over a session from timetable.get_session(), for the sync poll loop.
+    Each call runs on its own event loop with its own AsyncClient, so no connection outlives its loop.
+    """
+    async def run() -> list[FetchResult]:
+        if isinstance(session, dict):
+            return await fetch_many_results(session, elements, **options)
+        client = _client_for(session)
+        try:
+            return await fetch_many_results(client, elements, **options)
+        finally:
+            await client.aclose()
+
+    return asyncio.run(run())
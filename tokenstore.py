@@ -0,0 +1,77 @@
+"""
+tokenstore.py – Encrypted on-disk cache for the WebUntis REST bearer token.
+
+Lets a restarted watcher (including the frozen exe started at logon) reuse a
+still-valid token instead of requesting a new one. The file is encrypted with
+Fernet using a key derived from UNTIS_API_PASSWORD, so it is useless without
+the .env it was created with; changing the password simply invalidates it.
+
+Requires the optional `cryptography` package. Without it, or with
+TOKEN_CACHE=false, load() returns None and save() does nothing.
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+from config import TOKEN_CACHE, UNTIS_API_PASSWORD, UNTIS_CLIENT_ID, UNTIS_TENANT_ID, base_path
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:
+    Fernet = None
+    InvalidToken = ValueError
+
+logger = logging.getLogger("untis-watcher")
+
+# Next to the exe when frozen; __file__ would point into the onefile _MEI temp dir
+_TOKEN_FILE = Path(base_path) / "token_cache.bin"
+_KDF_ITERATIONS = 200_000
+
+_fernet = None
+
+
+def _get_fernet():
+    global _fernet
+    if _fernet is None:
+        salt = f"untis-watcher:{UNTIS_TENANT_ID}:{UNTIS_CLIENT_ID}".encode("utf-8")
+        key = hashlib.pbkdf2_hmac("sha256", (UNTIS_API_PASSWORD or "").encode("utf-8"), salt, _KDF_ITERATIONS)
+        _fernet = Fernet(base64.urlsafe_b64encode(key))
+    return _fernet
+
+
+def enabled() -> bool:
+    """Return whether the on-disk token cache is configured and usable."""
+    if not TOKEN_CACHE or not UNTIS_API_PASSWORD:
+        return False
+    if Fernet is None:
+        logger.warning("[untis] TOKEN_CACHE is enabled but the 'cryptography' package is not installed; "
+                       "the REST token will not be persisted.")
+        return False
+    return True
+
+
+def load() -> tuple[str, float] | None:
+    """Return (access_token, expires_at) from disk, or None when missing or unreadable."""
+    if not _TOKEN_FILE.exists():
+        return None
+    try:
+        cached = json.loads(_get_fernet().decrypt(_TOKEN_FILE.read_bytes()))
+        return str(cached["access_token"]), float(cached["expires_at"])
+    except (OSError, InvalidToken, ValueError, KeyError, TypeError):
+        logger.info("[untis] Ignoring unreadable %s (credentials changed?).", _TOKEN_FILE.name)
+        return None
+
+
+def save(access_token: str, expires_at: float) -> None:
+    """Encrypt and write the token using an atomic replace."""
+    payload = json.dumps({"access_token": access_token, "expires_at": expires_at}).encode("utf-8")
+    temp_file = _TOKEN_FILE.with_suffix(".tmp")
+    try:
+        temp_file.write_bytes(_get_fernet().encrypt(payload))
+        os.replace(temp_file, _TOKEN_FILE)
+    except OSError as exc:
+        logger.warning("[untis] Could not write %s: %s", _TOKEN_FILE.name, exc)